@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of filter_datum: one re.sub per field (the previous
+implementation) against the single-pass compiled pattern, for the
+PII_FIELDS of a users row, then for 10, 100 and 1000 fields.
+
+Usage: ./benchmark_filter_datum.py [lines]
+"""
+import re
+import sys
+import time
+from typing import List
+
+filtered_logger = __import__('filtered_logger')
+filter_datum = filtered_logger.filter_datum
+USERS_ROW = ("name=Marlene Wood;email=hwestiii@att.net;"
+             "phone=(473) 401-4253;ssn=261-72-6780;password=K5?BMNv;"
+             "ip=60ed:c396:2ff:244:bbd0:9208:26f2:93ea;"
+             "last_login=2019-11-14 06:14:24;"
+             "user_agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64);")
+
+
+def legacy_filter_datum(fields: List[str], redaction: str,
+                        message: str, separator: str) -> str:
+    """the previous implementation, kept here for comparison"""
+    for field in fields:
+        message = re.sub(rf'{field}=(.*?){separator}',
+                         f'{field}={redaction}{separator}', message)
+    return message
+
+
+def lines_per_sec(func, fields: List[str], messages: List[str]) -> float:
+    """returns how many messages func redacts per second"""
+    start = time.perf_counter()
+    for message in messages:
+        func(fields, '***', message, ';')
+    return len(messages) / (time.perf_counter() - start)
+
+
+def main(n_lines: int) -> None:
+    """runs the benchmark for PII_FIELDS, 10, 100 and 1000 field configs"""
+    print("{:>7} {:>15} {:>15} {:>8}".format(
+        "fields", "legacy lines/s", "single lines/s", "speedup"))
+    cases = [(list(filtered_logger.PII_FIELDS), USERS_ROW)]
+    for n_fields in (10, 100, 1000):
+        fields = ["field{}".format(i) for i in range(n_fields)]
+        cases.append((fields, "".join("{}=value{};".format(f, i)
+                                      for i, f in enumerate(fields[:20]))))
+    for fields, message in cases:
+        n_fields = len(fields)
+        messages = [message] * n_lines
+        assert (legacy_filter_datum(fields, '***', message, ';') ==
+                filter_datum(fields, '***', message, ';'))
+        legacy = lines_per_sec(legacy_filter_datum, fields,
+                               messages[:max(1, n_lines // n_fields)])
+        single = lines_per_sec(filter_datum, fields, messages)
+        print("{:>7} {:>15.0f} {:>15.0f} {:>7.1f}x".format(
+            n_fields, legacy, single, single / legacy))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -1,13 +1,138 @@
 #!/usr/bin/env python3
 """defines a function that hashes a password"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
+import os
+import time
 import bcrypt
 
+DEFAULT_ROUNDS = 12
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
 
-def hash_password(password: str) -> bytes:
+
+def hash_password(password: str, rounds: int = DEFAULT_ROUNDS) -> bytes:
     """returns a salted, hashed password, which is a byte string"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds))
 
 
 def is_valid(hashed_password: bytes, password: str) -> bool:
     """returns a boolean"""
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+
+
+def needs_rehash(hashed_password: bytes,
+                 rounds: int = DEFAULT_ROUNDS) -> bool:
+    """returns whether hashed_password is not a $2b$ hash of cost rounds
+
+    Hashes with a lower cost, an older bcrypt variant or an unknown
+    format should be replaced the next time the password is known.
+    """
+    if hashed_password[:4] != b'$2b$' or hashed_password[6:7] != b'$':
+        return True
+    try:
+        return int(hashed_password[4:6]) < rounds
+    except ValueError:
+        return True
+
+
+def verify_and_update(hashed_password: bytes, password: str,
+                      rounds: int = DEFAULT_ROUNDS
+                      ) -> Tuple[bool, Optional[bytes]]:
+    """checks password and returns (valid, new hash or None)
+
+    A new hash, made with rounds, is only returned when the password
+    is valid and needs_rehash says the stored hash is outdated.
+    """
+    if not is_valid(hashed_password, password):
+        return False, None
+    if needs_rehash(hashed_password, rounds):
+        return True, hash_password(password, rounds)
+    return True, None
+
+
+def calibrate_rounds(target_ms: float = 250.0,
+                     min_rounds: int = MIN_ROUNDS,
+                     max_rounds: int = MAX_ROUNDS) -> int:
+    """returns the highest cost whose hash takes at most target_ms here
+
+    Each extra round doubles the work, so rounds are tried upwards from
+    min_rounds and the search stops once the next one would be
+    expected to exceed the target.
+    """
+    rounds = min_rounds
+    while rounds < max_rounds:
+        start = time.perf_counter()
+        hash_password("calibration", rounds)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms * 2 > target_ms:
+            break
+        rounds += 1
+    return rounds
+
+
+class PasswordHasher:
+    """ bcrypt hashing with a fixed cost and a pool of worker threads
+
+        bcrypt releases the GIL while hashing, so hash_many and
+        verify_many spread a batch over max_workers threads.
+        """
+
+    def __init__(self, rounds: int = DEFAULT_ROUNDS,
+                 max_workers: int = None):
+        if not MIN_ROUNDS <= rounds <= MAX_ROUNDS:
+            raise ValueError("rounds must be between {} and {}".format(
+                MIN_ROUNDS, MAX_ROUNDS))
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or os.cpu_count() or 1)
+
+    @classmethod
+    def calibrated(cls, target_ms: float = 250.0,
+                   max_workers: int = None) -> 'PasswordHasher':
+        """returns a hasher using calibrate_rounds(target_ms)"""
+        return cls(calibrate_rounds(target_ms), max_workers)
+
+    def hash(self, password: str) -> bytes:
+        """returns password hashed at this hasher's cost"""
+        return hash_password(password, self.rounds)
+
+    def verify(self, hashed_password: bytes, password: str) -> bool:
+        """returns whether password matches hashed_password"""
+        return is_valid(hashed_password, password)
+
+    def verify_and_upgrade(self, hashed_password: bytes, password: str,
+                           on_upgrade: Callable[[bytes], None]) -> bool:
+        """checks password and upgrades an outdated hash in the background
+
+        When the password is valid but hashed_password needs a rehash,
+        the new hash is computed on the worker threads and passed to
+        on_upgrade, which should store it; the caller does not wait.
+        """
+        if not self.verify(hashed_password, password):
+            return False
+        if needs_rehash(hashed_password, self.rounds):
+            self._executor.submit(
+                lambda: on_upgrade(self.hash(password)))
+        return True
+
+    def hash_many(self, passwords: Iterable[str]) -> List[bytes]:
+        """returns the hashes of passwords, in the same order"""
+        return list(self._executor.map(self.hash, passwords))
+
+    def verify_many(self,
+                    pairs: Iterable[Tuple[bytes, str]]) -> List[bool]:
+        """checks (hashed_password, password) pairs, in the same order"""
+        return list(self._executor.map(lambda p: self.verify(*p), pairs))
+
+    def close(self) -> None:
+        """stops the worker threads"""
+        self._executor.shutdown()
+
+    def __enter__(self) -> 'PasswordHasher':
+        """returns the hasher for use in a with block"""
+        return self
+
+    def __exit__(self, *exc) -> None:
+        """closes the hasher at the end of a with block"""
+        self.close()
@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
 """defines  a function"""
-from typing import List
+from typing import Callable, Dict, Iterable, Iterator, List, Mapping
+from typing import Optional, Pattern, TextIO, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+import collections
+import io
 import re
 import logging
 import os
+import queue
+import sys
+import threading
+import time
 import mysql.connector
 
 
@@ -20,29 +30,178 @@ class RedactingFormatter(logging.Formatter):
         self.fields = fields
 
     def format(self, record: logging.LogRecord) -> str:
-        """format the record"""
+        """format the record
+
+        A record whose message is a mapping is redacted by key with
+        filter_mapping; any other message goes through filter_datum.
+        """
+        if isinstance(record.msg, Mapping) and not record.args:
+            message = filter_mapping(self.fields, self.REDACTION,
+                                     record.msg, self.SEPARATOR)
+            if record.exc_info or record.exc_text or record.stack_info:
+                record = logging.makeLogRecord(record.__dict__)
+                record.msg = message
+                return filter_datum(self.fields, self.REDACTION,
+                                    super().format(record), self.SEPARATOR)
+            record.message = message
+            if self.usesTime():
+                record.asctime = self.formatTime(record, self.datefmt)
+            return self.formatMessage(record)
         return filter_datum(self.fields, self.REDACTION,
                             super().format(record), self.SEPARATOR)
 
 
+@lru_cache(maxsize=128)
+def _redaction_pattern(fields: Tuple[str, ...],
+                       separator: str) -> Pattern[str]:
+    """returns one compiled pattern matching every field at once"""
+    names = "|".join(re.escape(field) for field in fields)
+    return re.compile(r'({})=.*?{}'.format(names, re.escape(separator)))
+
+
 def filter_datum(fields: List[str], redaction: str,
                  message: str, separator: str) -> str:
-    """returns the log message obfuscated"""
-    for field in fields:
-        message = re.sub(rf'{field}=(.*?){separator}',
-                         f'{field}={redaction}{separator}', message)
-    return message
+    """returns the log message obfuscated
+
+    The replacement is a function rather than a template: expanding a
+    template on every match costs more than the scan itself.
+    """
+    if not fields:
+        return message
+    pattern = _redaction_pattern(tuple(fields), separator)
+    suffix = "=" + redaction + separator
+    return pattern.sub(lambda match: match[1] + suffix, message)
+
+
+class QueueingHandler(logging.Handler):
+    """ Handler that queues records for a background writer thread
+
+        The calling thread only enqueues the record; formatting (and so
+        redaction) and the write happen in the worker, which drains up to
+        batch_size records at a time and writes them in one call.
+        When the queue is full, the "block" policy waits up to timeout
+        seconds for room and the "drop" policy discards the record and
+        counts it in dropped. Records emitted after close() are counted
+        in dropped too.
+        """
+
+    OVERFLOW_POLICIES = ("block", "drop")
+    terminator = "\n"
+
+    def __init__(self, stream: TextIO = None, maxsize: int = 10000,
+                 batch_size: int = 512, overflow: str = "block",
+                 timeout: float = None):
+        super(QueueingHandler, self).__init__()
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of {}".format(
+                self.OVERFLOW_POLICIES))
+        self.stream = stream if stream is not None else sys.stderr
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.timeout = timeout
+        self.dropped = 0
+        self.queue = queue.Queue(maxsize)
+        self._stop = object()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run,
+                                        name="QueueingHandler",
+                                        daemon=True)
+        self._worker.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """queue the record, applying the overflow policy"""
+        if self._closed:
+            self.dropped += 1
+            return
+        try:
+            if self.overflow == "block":
+                self.queue.put(record, timeout=self.timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        """format and write queued records in batches until stopped"""
+        stopped = False
+        while not stopped:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            for record in batch:
+                if record is self._stop:
+                    stopped = True
+                    continue
+                try:
+                    lines.append(self.format(record))
+                except Exception:
+                    self.handleError(record)
+            if lines:
+                try:
+                    self.stream.write(
+                        self.terminator.join(lines) + self.terminator)
+                    self.stream.flush()
+                except Exception:
+                    self.handleError(batch[0])
+            for _ in batch:
+                self.queue.task_done()
+
+    def flush(self) -> None:
+        """block until every queued record has been written"""
+        if self._worker.is_alive():
+            self.queue.join()
+
+    def close(self) -> None:
+        """write what is queued, then stop the worker thread
+
+        logging.shutdown() calls this at interpreter exit, so queued
+        records are not lost when the process ends normally. The stop
+        marker is queued under the handler lock, which handle() holds
+        while emitting, so no record is queued after it.
+        """
+        with self.lock:
+            stop = not self._closed and self._worker.is_alive()
+            self._closed = True
+            if stop:
+                self.queue.put(self._stop)
+        if stop:
+            self._worker.join()
+        super(QueueingHandler, self).close()
+
+
+def filter_mapping(fields: List[str], redaction: str,
+                   data: Mapping[str, object], separator: str) -> str:
+    """returns data as a "k=v; " message with the fields values obfuscated
+
+    Keys are compared exactly, so no regex scan is needed.
+    """
+    hidden = fields if isinstance(fields, frozenset) else frozenset(fields)
+    return " ".join("{}={}{}".format(k, redaction if k in hidden else v,
+                                     separator)
+                    for k, v in data.items())
 
 
 PII_FIELDS = ('name', 'email', 'phone', 'ssn', 'password',)
 
 
-def get_logger() -> logging.Logger:
-    """returns a logging object"""
+def get_logger(asynchronous: bool = False, overflow: str = "block",
+               maxsize: int = 10000) -> logging.Logger:
+    """returns a logging object
+
+    With asynchronous set, records are redacted and written by a
+    background QueueingHandler instead of in the calling thread.
+    """
     logger = logging.getLogger('user_data')
     logger.setLevel(logging.INFO)
     logger.propagate = False
-    stream = logging.StreamHandler()
+    if asynchronous:
+        stream = QueueingHandler(maxsize=maxsize, overflow=overflow)
+    else:
+        stream = logging.StreamHandler()
     stream.setFormatter(RedactingFormatter(
         fields=PII_FIELDS))
     logger.addHandler(stream)
@@ -63,19 +222,279 @@ def get_db() -> mysql.connector.connection.MySQLConnection:
     return conn
 
 
-def main() -> None:
-    """main function"""
-    db = get_db()
-    logger = get_logger()
+class ConnectionPool:
+    """ Pool of database connections shared by the threads of a process
+
+        Up to size connections are kept open between checkouts and up to
+        max_overflow more are opened under load, then closed on release.
+        A connection idle for longer than idle_timeout seconds is
+        replaced, and with pre_ping an idle connection is checked with
+        is_connected() before it is handed out. stats counts checkouts,
+        checkouts that had to wait, and reconnects.
+        """
+
+    def __init__(self, size: int = 5, max_overflow: int = 10,
+                 idle_timeout: float = 300.0, pre_ping: bool = True,
+                 timeout: float = 30.0,
+                 connect: Callable[[], mysql.connector.MySQLConnection]
+                 = get_db):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.idle_timeout = idle_timeout
+        self.pre_ping = pre_ping
+        self.timeout = timeout
+        self.stats = {"checkouts": 0, "waits": 0, "reconnects": 0}
+        self._connect = connect
+        self._idle = collections.deque()
+        self._open = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> mysql.connector.MySQLConnection:
+        """returns a connection, waiting up to timeout for a free one"""
+        deadline = time.monotonic() + self.timeout
+        limit = self.size + self.max_overflow
+        with self._cond:
+            self.stats["checkouts"] += 1
+            if not self._idle and self._open >= limit:
+                self.stats["waits"] += 1
+            while not self._idle and self._open >= limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise mysql.connector.errors.PoolError(
+                        "no connection available after {}s".format(
+                            self.timeout))
+                self._cond.wait(remaining)
+            if self._idle:
+                conn, released_at = self._idle.pop()
+            else:
+                conn, released_at = None, None
+                self._open += 1
+        try:
+            if conn is None:
+                return self._connect()
+            if (time.monotonic() - released_at > self.idle_timeout or
+                    (self.pre_ping and not conn.is_connected())):
+                self._close_quietly(conn)
+                with self._cond:
+                    self.stats["reconnects"] += 1
+                conn = self._connect()
+            return conn
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn: mysql.connector.MySQLConnection) -> None:
+        """gives a connection back to the pool"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            self._close_quietly(conn)
+            conn = None
+        with self._cond:
+            if conn is None or len(self._idle) >= self.size:
+                self._open -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[mysql.connector.MySQLConnection]:
+        """checks a connection out for the duration of a with block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        """closes every idle connection"""
+        with self._cond:
+            idle, self._idle = self._idle, collections.deque()
+            self._open -= len(idle)
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn: mysql.connector.MySQLConnection) -> None:
+        """closes conn, ignoring errors from an already broken link"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """returns the process-wide pool, configured from the environment"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                size=int(os.getenv('PERSONAL_DATA_DB_POOL_SIZE') or 5),
+                max_overflow=int(
+                    os.getenv('PERSONAL_DATA_DB_POOL_OVERFLOW') or 10),
+                idle_timeout=float(
+                    os.getenv('PERSONAL_DATA_DB_POOL_IDLE_TIMEOUT') or 300))
+        return _pool
+
+
+def format_rows(columns: Tuple[str, ...], rows: Iterable[tuple],
+                fields: Tuple[str, ...] = PII_FIELDS) -> str:
+    """returns the redacted log lines of a whole batch of rows
+
+    The lines match what get_logger() prints for one row: the text
+    around the message is formatted once per batch by a
+    RedactingFormatter, from a record of the user_data logger, and
+    values are redacted by column name, without a regex scan.
+    """
+    formatter = RedactingFormatter(fields)
+    record = logging.LogRecord('user_data', logging.INFO, __file__, 0,
+                               None, None, None)
+    record.message = "\0"
+    if formatter.usesTime():
+        record.asctime = formatter.formatTime(record, formatter.datefmt)
+    prefix, suffix = formatter.formatMessage(record).split("\0", 1)
+    suffix += "\n"
+    fields = frozenset(fields)
+    return "".join(
+        prefix + filter_mapping(fields, formatter.REDACTION,
+                                dict(zip(columns, row)),
+                                formatter.SEPARATOR) + suffix
+        for row in rows)
+
+
+def export_users(db: mysql.connector.connection.MySQLConnection,
+                 stream: TextIO, batch_size: int = 1000,
+                 query: str = "SELECT * FROM users",
+                 params: tuple = ()) -> int:
+    """streams the redacted users table to stream, returns the row count
+
+    Rows are read through an unbuffered cursor with fetchmany, so only
+    one batch is held in memory, and each batch is one stream.write.
+    """
+    count = 0
+    cursor = db.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        columns = tuple(cursor.column_names)
+        rows = cursor.fetchmany(batch_size)
+        while rows:
+            stream.write(format_rows(columns, rows))
+            count += len(rows)
+            rows = cursor.fetchmany(batch_size)
+    finally:
+        cursor.close()
+    return count
+
+
+_worker_db = None
+
+
+def _init_export_worker() -> None:
+    """opens the connection a shard export process uses for its life"""
+    global _worker_db
+    _worker_db = get_db()
+
+
+def _export_shard(key: str, low: int, high: int, batch_size: int,
+                  path: Optional[str]) -> Tuple[int, str]:
+    """exports the rows with low <= key < high
+
+    Returns the row count and either path, when the shard was written
+    to that file, or the redacted text itself.
+    """
+    query = "SELECT * FROM users WHERE {0} >= %s AND {0} < %s " \
+            "ORDER BY {0}".format(key)
+    if path is not None:
+        with open(path, 'w', buffering=1 << 20) as f:
+            count = export_users(_worker_db, f, batch_size, query,
+                                 (low, high))
+        return count, path
+    buffer = io.StringIO()
+    count = export_users(_worker_db, buffer, batch_size, query, (low, high))
+    return count, buffer.getvalue()
+
+
+def export_users_parallel(db: mysql.connector.connection.MySQLConnection,
+                          stream: TextIO = None, workers: int = None,
+                          key: str = "id", shards: int = None,
+                          out_dir: str = None,
+                          batch_size: int = 1000) -> int:
+    """exports the users table from a pool of processes
+
+    The table is split into shards key ranges between MIN(key) and
+    MAX(key) (key must be an integer column, 4 shards per worker by
+    default). Each worker process opens one connection and redacts its
+    shards; the output is either merged into stream in key order or,
+    with out_dir, written to one users-<n>.log file per shard (one of
+    stream and out_dir is required). Returns the number of rows exported.
+    """
+    if not key.isidentifier():
+        raise ValueError("invalid key column: {}".format(key))
+    if stream is None and out_dir is None:
+        raise ValueError("a stream or an out_dir is required")
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers * 4
     cursor = db.cursor()
-    cursor.execute("SELECT * FROM users")
-    fields = cursor.column_names
-    for row in cursor:
-        message = "".join("{}={}; ".format(k, v) for k, v in zip(fields, row))
-        logger.info(message.strip())
+    cursor.execute("SELECT MIN({0}), MAX({0}) FROM users".format(key))
+    low, high = cursor.fetchone()
     cursor.close()
-    db.close()
+    if low is None:
+        return 0
+    step = (high - low) // shards + 1
+    tasks = []
+    for n, start in enumerate(range(low, high + 1, step)):
+        path = None
+        if out_dir is not None:
+            path = os.path.join(out_dir, "users-{:05d}.log".format(n))
+        tasks.append((key, start, start + step, batch_size, path))
+    count = 0
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_export_worker) as executor:
+        for rows, output in executor.map(_export_shard, *zip(*tasks)):
+            count += rows
+            if out_dir is None:
+                stream.write(output)
+    return count
+
+
+def main(batch_size: int = None, workers: int = None) -> None:
+    """main function
+
+    With workers, the table is exported by export_users_parallel; with
+    batch_size alone, by export_users; otherwise with one logger call
+    per row.
+    """
+    with get_pool().connection() as db:
+        if workers:
+            export_users_parallel(db, sys.stderr, workers,
+                                  os.getenv('PERSONAL_DATA_EXPORT_KEY')
+                                  or "id",
+                                  out_dir=os.getenv(
+                                      'PERSONAL_DATA_EXPORT_DIR'),
+                                  batch_size=batch_size or 1000)
+            return
+        if batch_size:
+            export_users(db, sys.stderr, batch_size)
+            return
+        logger = get_logger()
+        cursor = db.cursor()
+        cursor.execute("SELECT * FROM users")
+        fields = cursor.column_names
+        for row in cursor:
+            logger.info(dict(zip(fields, row)))
+        cursor.close()
 
 
 if __name__ == "__main__":
-    main()
+    main(int(os.getenv('PERSONAL_DATA_EXPORT_BATCH_SIZE') or 0),
+         int(os.getenv('PERSONAL_DATA_EXPORT_WORKERS') or 0))
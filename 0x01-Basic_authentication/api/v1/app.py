@@ -13,6 +13,7 @@ app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 auth = None
 auth = getenv("AUTH_TYPE")
+server_timing = getenv("AUTH_SERVER_TIMING", "0") == "1"
 
 if auth == "basic_auth":
     from api.v1.auth.basic_auth import BasicAuth
@@ -38,10 +39,25 @@ def bef_req():
         if auth.require_auth(request.path, excluded):
             if auth.authorization_header(request) is None:
                 abort(401, description="Unauthorized")
-            if auth.current_user(request) is None:
+            if auth.resolve_user(request) is None:
                 abort(403, description="Forbidden")
 
 
+@app.after_request
+def add_server_timing(response):
+    """
+    With AUTH_SERVER_TIMING=1, report the time spent authenticating the
+    request, per phase, in the Server-Timing header
+    """
+    if server_timing and auth is not None:
+        timings = auth.request_timings(request)
+        if timings:
+            response.headers.add("Server-Timing", ", ".join(
+                "auth-{};dur={:.3f}".format(phase, seconds * 1000)
+                for phase, seconds in timings.items()))
+    return response
+
+
 @app.errorhandler(404)
 def not_found(error) -> str:
     """ Not found handler
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """ Module of Index views
 """
+from datetime import datetime, timedelta
 from flask import jsonify, abort
 from api.v1.views import app_views
 
@@ -18,11 +19,15 @@ def status() -> str:
 def stats() -> str:
     """ GET /api/v1/stats
     Return:
-      - the number of each objects
+      - the number of each objects, and of users created in the last
+        hour and day
     """
     from models.user import User
+    now = datetime.utcnow()
     stats = {}
     stats['users'] = User.count()
+    stats['users_last_hour'] = User.count(now - timedelta(hours=1))
+    stats['users_last_day'] = User.count(now - timedelta(days=1))
     return jsonify(stats)
 
 
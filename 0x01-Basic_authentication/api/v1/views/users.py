@@ -2,18 +2,123 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import (Response, abort, jsonify, request,
+                   stream_with_context)
+from typing import Iterator, List, Tuple
+from models.base import parse_timestamp
 from models.user import User
+import json
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+NDJSON_MIMETYPE = "application/x-ndjson"
+MAX_BULK_SIZE = 100000
+FILTERS = ("email", "first_name", "last_name")
+RANGES = {"created_at": ("created_after", "created_before")}
+
+
+def users_query() -> dict:
+    """ Build the User.query() arguments of the query string:
+    FILTERS are matched exactly, RANGES bounds are exclusive
+    timestamps and fields is a comma-separated list of attributes
+
+    Raises ValueError for a malformed timestamp.
+    """
+    query = {"attributes": {k: request.args[k] for k in FILTERS
+                            if k in request.args},
+             "ranges": {}}
+    for attribute, names in RANGES.items():
+        bounds = tuple(request.args.get(name) for name in names)
+        if bounds != (None, None):
+            query["ranges"][attribute] = tuple(
+                None if b is None else parse_timestamp(b) for b in bounds)
+    if request.args.get("fields"):
+        query["fields"] = tuple(request.args["fields"].split(","))
+    return query
+
+
+def find_users(query: dict, after: str = None,
+               limit: int = None) -> Tuple[List[dict], List[str]]:
+    """ Return up to limit users matching query, by ascending ID after
+    the ID after, as JSON dictionaries, and their IDs
+    """
+    fields = query.get("fields")
+    if fields is not None and "id" not in fields:
+        users = User.query(after=after, limit=limit,
+                           **dict(query, fields=("id",) + fields))
+        return users, [user.pop("id") for user in users]
+    users = User.query(after=after, limit=limit, **query)
+    return users, [user["id"] for user in users]
+
+
+def stream_users(query: dict, after: str = None,
+                 limit: int = None) -> Iterator[str]:
+    """ Yield users matching query, by ascending ID after the ID after,
+    as JSON lines
+
+    Users are read from the store STREAM_BATCH_SIZE at a time, so only
+    one batch is in memory whatever the number of users.
+    """
+    while limit is None or limit > 0:
+        size = STREAM_BATCH_SIZE if limit is None \
+            else min(limit, STREAM_BATCH_SIZE)
+        users, ids = find_users(query, after, size)
+        for user in users:
+            yield json.dumps(user) + "\n"
+        if len(users) < size:
+            return
+        after = ids[-1]
+        if limit is not None:
+            limit -= len(users)
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - email, first_name, last_name: only the users with these values
+      - created_after, created_before: only the users created in this
+        range (exclusive, YYYY-MM-DDTHH:MM:SS)
+      - fields: comma-separated attributes to return, e.g. id,email
+      - limit: page size (default 100, at most 1000)
+      - cursor: the X-Next-Cursor of the previous page
+      - stream=1 (or Accept: application/x-ndjson): stream the users
+        as JSON lines; limit is then the total, without maximum
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented, or one page of them
+        ordered by ID, with X-Next-Cursor set when more remain
+      - 400 if a parameter is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    cursor = request.args.get("cursor")
+    limit = request.args.get("limit")
+    stream = request.args.get("stream") in ("1", "true") or \
+        NDJSON_MIMETYPE in request.headers.get("Accept", "")
+    if not request.args and not stream:
+        all_users = [user.to_json() for user in User.all()]
+        return jsonify(all_users)
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            return jsonify({'error': "limit must be a positive integer"}), 400
+    page_size = min(limit or PAGE_SIZE, MAX_PAGE_SIZE)
+    try:
+        query = users_query()
+        # when streaming, this only checks the query before responding
+        users, ids = find_users(query, cursor, 0 if stream else page_size + 1)
+    except (AttributeError, ValueError) as e:
+        return jsonify({'error': "Invalid query: {}".format(e)}), 400
+    if stream:
+        return Response(stream_with_context(stream_users(query, cursor,
+                                                         limit)),
+                        mimetype=NDJSON_MIMETYPE)
+    response = jsonify(users[:page_size])
+    if len(users) > page_size:
+        response.headers["X-Next-Cursor"] = ids[page_size - 1]
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -120,3 +225,143 @@ def update_user(user_id: str = None) -> str:
         user.last_name = rj.get('last_name')
     user.save()
     return jsonify(user.to_json()), 200
+
+
+def bulk_items() -> list:
+    """ Items of a bulk request body: a JSON array, or one JSON value
+    per line with Content-Type application/x-ndjson
+
+    Return None if the body is malformed or has more than
+    MAX_BULK_SIZE items.
+    """
+    if request.mimetype == NDJSON_MIMETYPE:
+        try:
+            items = [json.loads(line) for line in request.stream
+                     if line.strip()]
+        except ValueError:
+            return None
+    else:
+        items = request.get_json(silent=True)
+    if not isinstance(items, list) or len(items) > MAX_BULK_SIZE:
+        return None
+    return items
+
+
+@app_views.route('/users/bulk', methods=['POST'], strict_slashes=False)
+def create_users() -> str:
+    """ POST /api/v1/users/bulk
+    JSON body: array (or JSON lines) of objects with:
+      - email
+      - password
+      - last_name (optional)
+      - first_name (optional)
+    Return:
+      - array of results, in the order of the items: {"status": 201,
+        "user": User object JSON represented} or {"status": 400,
+        "error": message}
+      - 400 if the body is not an array of at most 100000 items
+    """
+    items = bulk_items()
+    if items is None:
+        return jsonify({'error': "Wrong format"}), 400
+    results = []
+    users, passwords = [], []
+    for item in items:
+        error_msg = None
+        if not isinstance(item, dict):
+            error_msg = "Wrong format"
+        elif item.get("email", "") == "":
+            error_msg = "email missing"
+        elif item.get("password", "") == "":
+            error_msg = "password missing"
+        if error_msg is not None:
+            results.append({'status': 400, 'error': error_msg})
+            continue
+        user = User()
+        user.email = item.get("email")
+        user.first_name = item.get("first_name")
+        user.last_name = item.get("last_name")
+        users.append(user)
+        passwords.append(item.get("password"))
+        results.append(user)
+    error_msg = None
+    try:
+        User.set_passwords(users, passwords)
+        User.save_many(users)
+    except Exception as e:
+        error_msg = "Can't create User: {}".format(e)
+    for i, result in enumerate(results):
+        if not isinstance(result, User):
+            continue
+        if error_msg is None:
+            results[i] = {'status': 201, 'user': result.to_json()}
+        else:
+            results[i] = {'status': 400, 'error': error_msg}
+    return jsonify(results), 200
+
+
+@app_views.route('/users/bulk', methods=['PUT'], strict_slashes=False)
+def update_users() -> str:
+    """ PUT /api/v1/users/bulk
+    JSON body: array (or JSON lines) of objects with:
+      - id
+      - last_name (optional)
+      - first_name (optional)
+    Return:
+      - array of results, in the order of the items: {"status": 200,
+        "user": User object JSON represented}, {"status": 404, "error":
+        "Not found"} if the User ID doesn't exist or {"status": 400,
+        "error": message}
+      - 400 if the body is not an array of at most 100000 items
+    """
+    items = bulk_items()
+    if items is None:
+        return jsonify({'error': "Wrong format"}), 400
+    results = []
+    users = []
+    for item in items:
+        if not isinstance(item, dict) or \
+                not isinstance(item.get("id"), str):
+            results.append({'status': 400, 'error': "Wrong format"})
+            continue
+        user = User.get(item.get("id"))
+        if user is None:
+            results.append({'status': 404, 'error': "Not found"})
+            continue
+        if item.get('first_name') is not None:
+            user.first_name = item.get('first_name')
+        if item.get('last_name') is not None:
+            user.last_name = item.get('last_name')
+        users.append(user)
+        results.append(user)
+    User.save_many(users)
+    for i, result in enumerate(results):
+        if isinstance(result, User):
+            results[i] = {'status': 200, 'user': result.to_json()}
+    return jsonify(results), 200
+
+
+@app_views.route('/users/bulk', methods=['DELETE'], strict_slashes=False)
+def delete_users() -> str:
+    """ DELETE /api/v1/users/bulk
+    JSON body: array (or JSON lines) of User IDs
+    Return:
+      - array of results, in the order of the IDs: {"status": 200} if
+        the User has been deleted, {"status": 404, "error": "Not found"}
+        if the User ID doesn't exist
+      - 400 if the body is not an array of at most 100000 items
+    """
+    items = bulk_items()
+    if items is None:
+        return jsonify({'error': "Wrong format"}), 400
+    results = []
+    users = {}
+    for item in items:
+        user = User.get(item) if isinstance(item, str) else None
+        if user is None or user.id in users:
+            results.append({'status': 404, 'error': "Not found"})
+            continue
+        users[user.id] = user
+        results.append({'status': 200})
+    User.remove_many(list(users.values()))
+    return jsonify(results), 200
@@ -2,38 +2,64 @@
 """ Base module
 """
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
-import json
+from typing import TypeVar, List, Iterable, Iterator, Tuple
+import itertools
+from models.engine import storage
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
-DATA = {}
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string
+
+    Zero-padded "YYYY-MM-DDTHH:MM:SS" strings, the only ones the
+    models write, go through datetime.fromisoformat; anything else is
+    left to strptime, so the accepted inputs and errors do not change.
+    """
+    if len(value) == 19 and value[4] == '-' and value[7] == '-' \
+            and value[10] == 'T' and value[13] == ':' and value[16] == ':':
+        return datetime.fromisoformat(value)
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def format_timestamp(value: datetime) -> str:
+    """ Format a datetime with TIMESTAMP_FORMAT
+
+    Uses datetime.isoformat when it gives the same string as strftime:
+    for naive datetimes with a four-digit year.
+    """
+    if value.tzinfo is None and value.year >= 1000:
+        return value.isoformat(timespec='seconds')
+    return value.strftime(TIMESTAMP_FORMAT)
 
 
 class Base():
     """ Base class
+
+    Objects are persisted by models.engine.storage, which indexes the
+    attributes listed in INDEXED_ATTRIBUTES. Instances keep their
+    attributes in __slots__, which subclasses extend with their own.
     """
 
+    __slots__ = ('id', 'created_at', 'updated_at')
+    INDEXED_ATTRIBUTES = ()
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
-        s_class = str(self.__class__.__name__)
-        if DATA.get(s_class) is None:
-            DATA[s_class] = {}
-
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = parse_timestamp(kwargs.get('created_at'))
         else:
             self.created_at = datetime.utcnow()
-        if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
-        else:
+        if kwargs.get('updated_at') is None:
             self.updated_at = datetime.utcnow()
+        elif kwargs.get('updated_at') == kwargs.get('created_at'):
+            self.updated_at = self.created_at
+        else:
+            self.updated_at = parse_timestamp(kwargs.get('updated_at'))
 
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
@@ -44,69 +70,98 @@ class Base():
             return False
         return (self.id == other.id)
 
-    def to_json(self, for_serialization: bool = False) -> dict:
-        """ Convert the object a JSON dictionary
+    def to_json(self, for_serialization: bool = False,
+                fields: Iterable[str] = None) -> dict:
+        """ Convert the object a JSON dictionary, restricted to the
+        attributes in fields when given
         """
         result = {}
-        for key, value in self.__dict__.items():
+        for key, value in self.attributes(fields):
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
+                result[key] = format_timestamp(value)
             else:
                 result[key] = value
         return result
 
+    @classmethod
+    def fields(cls) -> Tuple[str, ...]:
+        """ Names of the slot attributes of the class, base class first
+        """
+        fields = cls.__dict__.get('_fields')
+        if fields is None:
+            fields = tuple(name for klass in reversed(cls.__mro__)
+                           for name in klass.__dict__.get('__slots__', ())
+                           if name not in ('__dict__', '__weakref__'))
+            cls._fields = fields
+        return fields
+
+    def attributes(self, names: Iterable[str] = None
+                   ) -> Iterator[Tuple[str, object]]:
+        """ (name, value) pairs of the attributes that are set, among
+        names when given
+        """
+        for name in self.fields() if names is None else names:
+            try:
+                yield name, getattr(self, name)
+            except AttributeError:
+                continue
+        if names is None:
+            yield from getattr(self, '__dict__', {}).items()
+
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
-
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        storage.load(cls)
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        storage.save_all(cls)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def flush(cls):
+        """ Write pending changes; called on Base, for every class
+        """
+        storage.flush(None if cls is Base else cls)
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        storage.save(self)
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        storage.remove(self)
 
     @classmethod
-    def count(cls) -> int:
-        """ Count all objects
+    def save_many(cls, objs: List[TypeVar('Base')]):
+        """ Save objects of the class in a single store write
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        now = datetime.utcnow()
+        for obj in objs:
+            obj.updated_at = now
+        storage.save_many(cls, objs)
+
+    @classmethod
+    def remove_many(cls, objs: List[TypeVar('Base')]):
+        """ Remove objects of the class in a single store write
+        """
+        storage.remove_many(cls, objs)
+
+    @classmethod
+    def count(cls, created_after: datetime = None) -> int:
+        """ Count all objects, or the ones created after created_after
+
+        The storage maintains the counts, so this does not go through
+        the objects.
+        """
+        return storage.count(cls, created_after)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -114,24 +169,48 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def page(cls, after: str = None,
+             limit: int = None) -> List[TypeVar('Base')]:
+        """ Return up to limit objects ordered by ID, starting after
+        the ID after: a stable order to page through all objects
+        """
+        return storage.page(cls, after, limit)
+
+    @classmethod
+    def query(cls, attributes: dict = {}, ranges: dict = {},
+              after: str = None, limit: int = None,
+              fields: Tuple[str, ...] = None) -> List[dict]:
+        """ JSON dictionaries of the objects matching attributes and
+        ranges, ordered by ID and paged like page()
+
+        ranges maps attribute names to (low, high) exclusive bounds,
+        either of which can be None. The dictionaries only hold the
+        attributes in fields when given. Filtering and projection are
+        done by the storage, so unwanted objects and attributes are
+        never converted.
+
+        Raises AttributeError for an unknown attribute, or a private
+        one in fields.
+        """
+        for name in itertools.chain(attributes, ranges, fields or ()):
+            if name not in cls.fields():
+                raise AttributeError("'{}' object has no attribute '{}'"
+                                     .format(cls.__name__, name))
+        for name in fields or ():
+            if name[0] == '_':
+                raise AttributeError("'{}' attribute '{}' is private"
+                                     .format(cls.__name__, name))
+        return storage.query(cls, attributes, ranges, after, limit, fields)
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        return storage.get(cls, id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
-        s_class = cls.__name__
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+        return storage.search(cls, attributes)
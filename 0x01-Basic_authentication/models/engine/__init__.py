@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+""" Storage engines of the models
+
+MODELS_STORAGE selects the engine: "json" (default) keeps every object
+in memory and persists them to .db_<class>.json files; "sqlite" keeps
+them in the SQLite database at MODELS_SQLITE_PATH.
+"""
+from os import getenv
+
+if getenv("MODELS_STORAGE", "json") == "sqlite":
+    from models.engine.sqlite_storage import SQLiteStorage
+    storage = SQLiteStorage(getenv("MODELS_SQLITE_PATH", ".db.sqlite3"))
+else:
+    from models.engine.json_storage import JSONStorage
+    storage = JSONStorage()
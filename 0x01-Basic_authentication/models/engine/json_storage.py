@@ -0,0 +1,964 @@
+#!/usr/bin/env python3
+""" JSON file storage: every object in memory, persisted as a snapshot
+(.db_<class>.json) plus a journal of later changes (.db_<class>.journal)
+"""
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from datetime import datetime
+from typing import TypeVar, List, Iterable, Iterator, Tuple
+from os import getenv, path
+from models.engine.rwlock import RWLock
+import atexit
+import bisect
+import fcntl
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import threading
+
+
+COMPACT_EVERY = 1000
+CHUNK_SIZE = 10000
+WRITE_BEHIND = getenv("MODELS_WRITE_BEHIND", "0") == "1"
+FLUSH_INTERVAL = float(getenv("MODELS_FLUSH_INTERVAL", "1.0"))
+FLUSH_THRESHOLD = int(getenv("MODELS_FLUSH_THRESHOLD", "500"))
+SHARED = getenv("MODELS_SHARED", "0") == "1"
+DATA = {}
+INDEXES = {}
+JOURNAL_SIZES = {}
+PENDING = {}
+SORTED_IDS = {}
+CREATED_DATES = {}
+JOURNAL_OFFSETS = {}
+SNAPSHOT_STATS = {}
+LOCK_FILES = {}
+LOCKS_HELD = set()
+SNAPSHOTS = {}
+CLASS_LOCKS = {}
+COMPACTING = set()
+FILE_LOCK = threading.RLock()
+FLUSH_NEEDED = threading.Event()
+
+
+class LazyObjects(MutableMapping):
+    """ Objects of a class by ID, parsed from a snapshot on first access
+
+    Entries not accessed yet are the offset of their JSON line in the
+    memory-mapped snapshot; reading one builds the object and keeps it
+    in place of the offset. The created_at of the snapshot's objects,
+    when its index has them, are available without building them.
+    """
+
+    def __init__(self, cls: type, buffer: mmap.mmap = None,
+                 offsets: dict = None,
+                 created: Iterable[Tuple[str, str]] = ()):
+        """ Initialize the mapping over a snapshot buffer
+        """
+        self.cls = cls
+        self.buffer = buffer
+        self.entries = offsets if offsets is not None else {}
+        self._created = created
+        self._created_lock = threading.Lock()
+        self.parsed_all = not self.entries
+
+    @property
+    def created(self) -> dict:
+        """ created_at strings of the snapshot's objects by ID, read from
+        the snapshot index on first use, CHUNK_SIZE at a time
+        """
+        if type(self._created) is not dict:
+            with self._created_lock:
+                if type(self._created) is not dict:
+                    created, pairs = {}, iter(self._created)
+                    chunk = list(itertools.islice(pairs, CHUNK_SIZE))
+                    while chunk:
+                        created.update(chunk)
+                        chunk = list(itertools.islice(pairs, CHUNK_SIZE))
+                    self._created = created
+        return self._created
+
+    def __getitem__(self, obj_id: str) -> TypeVar('Base'):
+        """ Return the object, building it if needed
+        """
+        value = self.entries[obj_id]
+        if type(value) is int:
+            end = self.buffer.find(b"\n", value)
+            obj_json = json.loads(self.buffer[value:end])
+            obj_json['id'] = obj_id
+            value = self.cls(**obj_json)
+            self.entries[obj_id] = value
+        return value
+
+    def __setitem__(self, obj_id: str, obj: TypeVar('Base')):
+        """ Store an object
+        """
+        self.entries[obj_id] = obj
+
+    def __delitem__(self, obj_id: str):
+        """ Forget an object
+        """
+        del self.entries[obj_id]
+        if type(self._created) is dict:
+            self._created.pop(obj_id, None)
+
+    def __contains__(self, obj_id: object) -> bool:
+        """ Tell whether the ID is stored, without building the object
+        """
+        return obj_id in self.entries
+
+    def __iter__(self) -> Iterator[str]:
+        """ Iterate over the IDs
+        """
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        """ Number of objects
+        """
+        return len(self.entries)
+
+    def values(self) -> List[TypeVar('Base')]:
+        """ List the objects, building the ones not accessed yet
+        """
+        if not self.parsed_all:
+            for obj_id, value in list(self.entries.items()):
+                if type(value) is int:
+                    self[obj_id]
+            self.parsed_all = True
+        return list(self.entries.values())
+
+    def created_at(self, obj_id: str) -> datetime:
+        """ Return the created_at of an object, from the snapshot index
+        if the object was not built yet
+        """
+        from models.base import parse_timestamp
+        if type(self.entries[obj_id]) is int and obj_id in self.created:
+            return parse_timestamp(self.created[obj_id])
+        return self[obj_id].created_at
+
+
+def write_snapshot(file_path: str, records: Iterable[Tuple[str, bytes]],
+                   indexed: dict):
+    """ Atomically replace file_path with a checksummed snapshot
+
+    The snapshot is a header line holding the SHA-256 of the rest, a
+    line with the offset index (IDs, line offsets and the values of
+    the indexed attributes and of created_at), then one JSON line per
+    object. It is written to a temporary file, fsynced and renamed over
+    file_path, so readers see the old or the new snapshot and never a
+    partial one.
+    """
+    install_snapshot(prepare_snapshot(file_path, records, indexed),
+                     file_path)
+
+
+def prepare_snapshot(file_path: str, records: Iterable[Tuple[str, bytes]],
+                     indexed: dict) -> str:
+    """ Write the snapshot of write_snapshot to a temporary file next to
+    file_path, fsynced, and return its path
+
+    The index and the lines are encoded, hashed and written in chunks,
+    never in one long call, so other threads keep running meanwhile.
+    """
+    ids, offsets, lines, position = [], [], [], 0
+    for obj_id, line in records:
+        ids.append(obj_id)
+        offsets.append(position)
+        lines.append(line)
+        position += len(line) + 1
+    index = b"".join([b'{"ids": ', _json_list(ids), b', "offsets": ',
+                      _json_list(offsets), b', "indexed": {',
+                      b", ".join(json.dumps(attribute).encode() + b": " +
+                                 _json_list(values)
+                                 for attribute, values in indexed.items()),
+                      b"}}\n"])
+    digest = hashlib.sha256(index)
+    tmp_path = "{}.{}.{}.tmp".format(file_path, os.getpid(),
+                                     threading.get_ident())
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.seek(len(_snapshot_header("0" * 64)))
+            f.write(index)
+            for start in range(0, len(lines), CHUNK_SIZE):
+                chunk = b"\n".join(lines[start:start + CHUNK_SIZE]) + b"\n"
+                digest.update(chunk)
+                f.write(chunk)
+            f.seek(0)
+            f.write(_snapshot_header(digest.hexdigest()))
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+def _snapshot_header(sha256: str) -> bytes:
+    """ First line of a snapshot whose payload has this SHA-256
+    """
+    return json.dumps({"sha256": sha256, "format": 2}).encode() + b"\n"
+
+
+def _json_list(values: list) -> bytes:
+    """ Encode a list as JSON, CHUNK_SIZE values at a time
+    """
+    return b"[" + b", ".join(
+        json.dumps(values[start:start + CHUNK_SIZE])[1:-1].encode()
+        for start in range(0, len(values), CHUNK_SIZE)) + b"]"
+
+
+def install_snapshot(tmp_path: str, file_path: str):
+    """ Rename a snapshot written by prepare_snapshot over file_path and
+    make the rename durable
+    """
+    try:
+        os.replace(tmp_path, file_path)
+    finally:
+        if path.exists(tmp_path):
+            os.remove(tmp_path)
+    dir_fd = os.open(path.dirname(path.abspath(file_path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def snapshot_records(entries: List[tuple], lazy: LazyObjects,
+                     values: dict) -> Tuple[List[Tuple[str, bytes]], dict]:
+    """ Return the (ID, JSON line) pairs and the indexed values of a
+    snapshot of what JSONStorage.collect() returned, reusing the lines
+    of the objects not built yet
+    """
+    from models.base import format_timestamp
+    buffer = lazy.buffer if lazy is not None else None
+    created = lazy.created if lazy is not None else {}
+    dates, records = [], []
+    for obj_id, value in entries:
+        if type(value) is int:
+            line = buffer[value:buffer.find(b"\n", value)]
+            date = created.get(obj_id)
+            if date is None:
+                date = json.loads(line)["created_at"]
+        else:
+            line = json.dumps(value.to_json(True)).encode()
+            date = format_timestamp(value.created_at)
+        records.append((obj_id, line))
+        dates.append(date)
+    indexed = {attribute: [by_id.get(obj_id) for obj_id, _ in entries]
+               for attribute, by_id in values.items()}
+    indexed["created_at"] = dates
+    return records, indexed
+
+
+def read_snapshot(file_path: str) -> Tuple[object, dict, dict]:
+    """ Open a snapshot written by write_snapshot
+
+    Returns (buffer, entries, indexed): the memory-mapped file, the
+    offset of each object's line by ID and, by indexed attribute (and
+    "created_at", if the snapshot has them), (ID, value) pairs.
+    Snapshots of older formats (a JSON object of all objects, optionally
+    after a checksum header) are parsed at once: buffer is None and
+    entries holds the JSON dictionaries.
+    Raises ValueError if the content does not match its checksum.
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None, {}, {}
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header_end = buffer.find(b"\n")
+    header = buffer[:header_end] if header_end >= 0 else b""
+    if not header.startswith(b'{"sha256"'):
+        return None, json.loads(buffer[:]), {}
+    header = json.loads(header)
+    with memoryview(buffer) as payload:
+        digest = hashlib.sha256(payload[header_end + 1:]).hexdigest()
+    if digest != header["sha256"]:
+        raise ValueError("{} is corrupted: checksum mismatch".format(
+            file_path))
+    if header.get("format", 1) < 2:
+        return None, json.loads(buffer[header_end + 1:]), {}
+    index_end = buffer.find(b"\n", header_end + 1)
+    index = json.loads(buffer[header_end + 1:index_end])
+    data_start = index_end + 1
+    ids = index["ids"]
+    entries = {obj_id: data_start + offset
+               for obj_id, offset in zip(ids, index["offsets"])}
+    indexed = {attribute: zip(ids, values)
+               for attribute, values in index["indexed"].items()}
+    return buffer, entries, indexed
+
+
+class Index():
+    """ Hash index of the IDs of the saved objects of a class by one
+    attribute
+
+    Each value maps to a tuple of IDs, usually of a single one.
+    """
+
+    def __init__(self, attribute: str):
+        """ Initialize an empty index
+        """
+        self.attribute = attribute
+        self.ids = {}
+        self.values = {}
+
+    def add(self, obj: TypeVar('Base')):
+        """ Index obj under the current value of the attribute
+        """
+        self.add_value(obj.id, getattr(obj, self.attribute, None))
+
+    def add_value(self, obj_id: str, value):
+        """ Index the object with this ID under value
+        """
+        self.discard(obj_id)
+        try:
+            self.ids[value] = self.ids.get(value, ()) + (obj_id,)
+        except TypeError:
+            return
+        self.values[obj_id] = value
+
+    def discard(self, obj_id: str):
+        """ Remove the object with this ID from the index
+        """
+        if obj_id not in self.values:
+            return
+        value = self.values.pop(obj_id)
+        bucket = tuple(i for i in self.ids[value] if i != obj_id)
+        if bucket:
+            self.ids[value] = bucket
+        else:
+            del self.ids[value]
+
+    def get(self, value) -> List[str]:
+        """ Return the IDs of the objects saved with this value
+        """
+        return list(self.ids.get(value, ()))
+
+
+class JSONStorage():
+    """ Storage keeping the objects of each class in DATA[<class name>]
+
+    save() and remove() append to the journal, which is folded into a
+    new snapshot every COMPACT_EVERY changes. In write-behind mode
+    (MODELS_WRITE_BEHIND=1) journal records are queued and written in
+    batches by a background thread.
+
+    In shared mode (MODELS_SHARED=1) several processes, such as the
+    workers of a WSGI server, use the same files. Changes are written
+    through, under an exclusive flock of .db_<class>.lock. Before
+    each read, a process replays the journal records that other
+    processes appended since its last read. The journal offset it has
+    reached is its change sequence number. It reloads everything only
+    when another process compacted the journal into a new snapshot.
+
+    Each class has a reader/writer lock: changes hold it as the writer,
+    lookups that need several structures to agree hold it as readers.
+    Full scans instead go through snapshot(), an immutable copy of the
+    objects rebuilt after changes, and run without holding the lock.
+    """
+
+    def objects(self, cls: type) -> MutableMapping:
+        """ Return the objects of cls by ID
+        """
+        return DATA.setdefault(cls.__name__, {})
+
+    def indexes(self, cls: type) -> dict:
+        """ Return the indexes of cls, by attribute
+        """
+        indexes = INDEXES.get(cls.__name__)
+        if indexes is None:
+            indexes = INDEXES.setdefault(
+                cls.__name__, {attribute: Index(attribute)
+                               for attribute in cls.INDEXED_ATTRIBUTES})
+        return indexes
+
+    def lock(self, cls: type) -> RWLock:
+        """ Return the reader/writer lock of cls
+        """
+        lock = CLASS_LOCKS.get(cls.__name__)
+        if lock is None:
+            lock = CLASS_LOCKS.setdefault(cls.__name__, RWLock())
+        return lock
+
+    def snapshot(self, cls: type) -> Tuple[TypeVar('Base'), ...]:
+        """ Return the objects of cls as a tuple, safe to iterate while
+        other threads make changes
+
+        Changes drop the tuple and the next call copies the objects
+        again (copy-on-write), so reads between changes share one copy.
+        """
+        snapshot = SNAPSHOTS.get(cls.__name__)
+        if snapshot is None:
+            with self.lock(cls).reading():
+                snapshot = SNAPSHOTS.get(cls.__name__)
+                if snapshot is None:
+                    snapshot = tuple(self.objects(cls).values())
+                    SNAPSHOTS[cls.__name__] = snapshot
+        return snapshot
+
+    def sorted_ids(self, cls: type) -> List[str]:
+        """ Return the IDs of cls in ascending order
+
+        The list is built on first use after a load, then save() and
+        remove() keep it sorted, so paging does not sort every time.
+        """
+        s_class = cls.__name__
+        with self.lock(cls).reading():
+            if s_class not in SORTED_IDS:
+                SORTED_IDS[s_class] = sorted(self.objects(cls))
+            return SORTED_IDS[s_class]
+
+    def created_dates(self, cls: type) -> List[datetime]:
+        """ Return the created_at of the objects of cls, sorted
+
+        Like sorted_ids(), the list is built on first use after a load
+        and kept sorted by save() and remove(); created_at is not
+        expected to change once an object is saved. The dates of the
+        objects not built yet come from the snapshot index.
+        """
+        s_class = cls.__name__
+        with self.lock(cls).reading():
+            if s_class not in CREATED_DATES:
+                objs = self.objects(cls)
+                if isinstance(objs, LazyObjects):
+                    dates = [objs.created_at(obj_id) for obj_id in objs]
+                else:
+                    dates = [obj.created_at for obj in objs.values()]
+                CREATED_DATES[s_class] = sorted(dates)
+            return CREATED_DATES[s_class]
+
+    def load(self, cls: type):
+        """ Load all objects of cls from file
+
+        The snapshot .db_<class>.json is read first, then the changes
+        recorded after it in .db_<class>.journal are replayed. Changes
+        still queued in write-behind mode are written first.
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        self.flush(cls)
+        with self._file_lock(cls, exclusive=False):
+            DATA[s_class] = LazyObjects(cls)
+            INDEXES[s_class] = {attribute: Index(attribute)
+                                for attribute in cls.INDEXED_ATTRIBUTES}
+            SNAPSHOTS.pop(s_class, None)
+            SORTED_IDS.pop(s_class, None)
+            CREATED_DATES.pop(s_class, None)
+            JOURNAL_SIZES[s_class] = 0
+            JOURNAL_OFFSETS[s_class] = 0
+            SNAPSHOT_STATS[s_class] = _file_stat(file_path)
+            indexes = self.indexes(cls).values()
+            if path.exists(file_path):
+                buffer, entries, indexed = read_snapshot(file_path)
+                if buffer is None:
+                    for obj_json in entries.values():
+                        obj = cls(**obj_json)
+                        DATA[s_class][obj.id] = obj
+                        for index in indexes:
+                            index.add(obj)
+                else:
+                    DATA[s_class] = LazyObjects(
+                        cls, buffer, entries, indexed.get("created_at", ()))
+                    for index in indexes:
+                        values = indexed.get(index.attribute)
+                        if values is None:
+                            for obj in DATA[s_class].values():
+                                index.add(obj)
+                            continue
+                        for obj_id, value in values:
+                            index.add_value(obj_id, value)
+            self._replay(cls)
+
+    def _replay(self, cls: type):
+        """ Apply the journal records of cls after JOURNAL_OFFSETS
+
+        A last line without its newline is a write cut short by a crash:
+        the offset stays before it and _write_journal() truncates it.
+        A complete line that does not parse is skipped.
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        if not path.exists(journal_path):
+            return
+        offset = JOURNAL_OFFSETS.get(s_class, 0)
+        with open(journal_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record["op"] == "save":
+                    self._put(cls, [cls(**record["obj"])])
+                else:
+                    self._delete(cls, [record["id"]])
+                JOURNAL_SIZES[s_class] = JOURNAL_SIZES.get(s_class, 0) + 1
+        JOURNAL_OFFSETS[s_class] = offset
+
+    @contextmanager
+    def _file_lock(self, cls: type, exclusive: bool = True):
+        """ Hold the lock of cls as the writer and, in shared mode, a
+        flock of the lock file of cls: exclusive to write, shared to read
+
+        Nested uses keep the flock taken first, so an exclusive one
+        must not be requested inside a shared one.
+        """
+        s_class = cls.__name__
+        with self.lock(cls).writing():
+            if not SHARED or s_class in LOCKS_HELD:
+                yield
+                return
+            pid, lock_file = LOCK_FILES.get(s_class, (None, None))
+            if pid != os.getpid():
+                # a forked worker must not share its parent's lock
+                lock_file = open(".db_{}.lock".format(s_class), 'a')
+                LOCK_FILES[s_class] = (os.getpid(), lock_file)
+            fcntl.flock(lock_file,
+                        fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            LOCKS_HELD.add(s_class)
+            try:
+                yield
+            finally:
+                LOCKS_HELD.discard(s_class)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _is_current(self, cls: type) -> bool:
+        """ Tell whether the files of cls are the ones last read
+        """
+        s_class = cls.__name__
+        journal = _file_stat(".db_{}.journal".format(s_class))
+        return s_class in JOURNAL_OFFSETS and \
+            SNAPSHOT_STATS[s_class] == _file_stat(
+                ".db_{}.json".format(s_class)) and \
+            JOURNAL_OFFSETS[s_class] == (journal[2] if journal else 0)
+
+    def refresh(self, cls: type):
+        """ In shared mode, catch up with the changes of cls made by
+        other processes
+
+        When neither file changed, this only costs two stat calls.
+        """
+        if not SHARED or self._is_current(cls):
+            return
+        with self._file_lock(cls, exclusive=False):
+            self._catch_up(cls)
+
+    def _catch_up(self, cls: type):
+        """ Replay the new journal records of cls, or reload it if its
+        snapshot was replaced; the file lock must be held
+        """
+        if self._is_current(cls):
+            return
+        s_class = cls.__name__
+        if s_class not in JOURNAL_OFFSETS or SNAPSHOT_STATS[s_class] != \
+                _file_stat(".db_{}.json".format(s_class)):
+            self.load(cls)
+            return
+        journal = _file_stat(".db_{}.journal".format(s_class))
+        if journal is None or journal[2] < JOURNAL_OFFSETS[s_class]:
+            self.load(cls)
+            return
+        self._replay(cls)
+
+    def collect(self, cls: type) -> Tuple[List[tuple], LazyObjects, dict]:
+        """ Return what a snapshot of cls is made of, with the lock of
+        cls held: (ID, object or offset of its line in the snapshot)
+        pairs, the LazyObjects holding the snapshot (None if there is
+        none) and copies of the values of the indexed attributes by ID
+
+        These are copies of whole dictionaries, so the lock is held
+        briefly. The objects may be serialized afterwards, without the
+        lock, by snapshot_records(): an object changed in the meantime
+        is saved again by a journal record written after the ones the
+        snapshot folds in. The created_at of the snapshot do not change.
+        """
+        objs = self.objects(cls)
+        if isinstance(objs, LazyObjects):
+            entries, lazy = list(objs.entries.items()), objs
+        else:
+            entries, lazy = list(objs.items()), None
+        values = {attribute: dict(index.values)
+                  for attribute, index in self.indexes(cls).items()}
+        return entries, lazy, values
+
+    def save_all(self, cls: type):
+        """ Save all objects of cls to file
+
+        This writes a full snapshot and empties the journal.
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        with self._file_lock(cls):
+            if SHARED:
+                self._catch_up(cls)
+            write_snapshot(file_path,
+                           *snapshot_records(*self.collect(cls)))
+            open(".db_{}.journal".format(s_class), 'w').close()
+            JOURNAL_SIZES[s_class] = 0
+            JOURNAL_OFFSETS[s_class] = 0
+            SNAPSHOT_STATS[s_class] = _file_stat(file_path)
+            with FILE_LOCK:
+                PENDING.pop(cls, None)
+
+    def _compact(self, cls: type):
+        """ Fold the journal of cls into a new snapshot, unless another
+        thread or process did it first
+
+        Only collecting the objects holds the lock of cls. The snapshot
+        is serialized, written and fsynced without it, so reads and
+        writes go on meanwhile. The lock is taken again to rename the
+        snapshot, if no other one replaced the snapshot it started
+        from, and to drop the folded records from the journal.
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        journal_path = ".db_{}.journal".format(s_class)
+        with FILE_LOCK:
+            if s_class in COMPACTING:
+                return
+            COMPACTING.add(s_class)
+        try:
+            with self._file_lock(cls):
+                if SHARED:
+                    self._catch_up(cls)
+                if JOURNAL_SIZES.get(s_class, 0) < COMPACT_EVERY:
+                    return
+                collected = self.collect(cls)
+                start = SNAPSHOT_STATS[s_class]
+                folded = JOURNAL_OFFSETS[s_class]
+                folded_records = JOURNAL_SIZES[s_class]
+            tmp_path = prepare_snapshot(file_path,
+                                        *snapshot_records(*collected))
+            try:
+                with self._file_lock(cls):
+                    if SHARED:
+                        self._catch_up(cls)
+                    if SNAPSHOT_STATS.get(s_class) != start:
+                        return
+                    with open(journal_path, 'rb') as f:
+                        f.seek(folded)
+                        rest = f.read(JOURNAL_OFFSETS[s_class] - folded)
+                    install_snapshot(tmp_path, file_path)
+                    journal_tmp = "{}.{}.{}.tmp".format(
+                        journal_path, os.getpid(), threading.get_ident())
+                    with open(journal_tmp, 'wb') as f:
+                        f.write(rest)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(journal_tmp, journal_path)
+                    JOURNAL_OFFSETS[s_class] = len(rest)
+                    JOURNAL_SIZES[s_class] -= folded_records
+                    SNAPSHOT_STATS[s_class] = _file_stat(file_path)
+            finally:
+                if path.exists(tmp_path):
+                    os.remove(tmp_path)
+        finally:
+            with FILE_LOCK:
+                COMPACTING.discard(s_class)
+
+    def append_to_journal(self, cls: type, *records: dict):
+        """ Record changes of cls at the end of its journal
+
+        In write-behind mode the change is only queued: a background
+        thread writes the queued changes of each class in one go every
+        FLUSH_INTERVAL seconds, or as soon as FLUSH_THRESHOLD are
+        waiting, and flush() forces it. Shared mode always writes
+        through, so that other processes see changes in order.
+        """
+        if not records:
+            return
+        lines = [json.dumps(record) for record in records]
+        if not WRITE_BEHIND or SHARED:
+            self._write_journal(cls, lines)
+            return
+        with FILE_LOCK:
+            PENDING.setdefault(cls, []).extend(lines)
+            waiting = len(PENDING[cls])
+        _start_flusher()
+        if waiting >= FLUSH_THRESHOLD:
+            FLUSH_NEEDED.set()
+
+    def _write_journal(self, cls: type, lines: List[str],
+                       sync: bool = False):
+        """ Append lines to the journal of cls with a single write
+
+        Anything after the last record read or written, i.e. a line torn
+        by a crash, is truncated first, so the new records do not get
+        appended to it.
+
+        Every COMPACT_EVERY journaled changes, a background thread
+        folds the journal into a new snapshot with _compact().
+        """
+        s_class = cls.__name__
+        with self._file_lock(cls):
+            with open(".db_{}.journal".format(s_class), 'a') as f:
+                offset = JOURNAL_OFFSETS.get(s_class)
+                if offset is not None and f.tell() > offset:
+                    f.truncate(offset)
+                f.write("\n".join(lines) + "\n")
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+                JOURNAL_OFFSETS[s_class] = f.tell()
+            before = JOURNAL_SIZES.get(s_class, 0)
+            JOURNAL_SIZES[s_class] = before + len(lines)
+            if before // COMPACT_EVERY == \
+                    JOURNAL_SIZES[s_class] // COMPACT_EVERY:
+                return
+        threading.Thread(target=self._compact, args=(cls,),
+                         name="compact-{}".format(s_class)).start()
+
+    def flush(self, cls: type = None):
+        """ Write the changes queued in write-behind mode
+
+        Without cls, every class is flushed. The write is fsynced, so
+        the changes are durable once it returns.
+        """
+        for klass in list(PENDING.keys()):
+            if cls is not None and klass is not cls:
+                continue
+            with self.lock(klass).writing():
+                with FILE_LOCK:
+                    lines = PENDING.pop(klass, None)
+                if lines:
+                    self._write_journal(klass, lines, sync=True)
+
+    def save(self, obj: TypeVar('Base')):
+        """ Save obj
+        """
+        self.save_many(type(obj), [obj])
+
+    def save_many(self, cls: type, objs: List[TypeVar('Base')]):
+        """ Save objs, of class cls, with a single journal write
+        """
+        with self._file_lock(cls):
+            if SHARED:
+                self._catch_up(cls)
+            self._put(cls, objs)
+            self.append_to_journal(cls, *({"op": "save",
+                                           "obj": obj.to_json(True)}
+                                          for obj in objs))
+
+    def _put(self, cls: type, objs: List[TypeVar('Base')]):
+        """ Store objs, of class cls, in memory and in the indexes
+        """
+        s_class = cls.__name__
+        stored = self.objects(cls)
+        indexes = self.indexes(cls).values()
+        SNAPSHOTS.pop(s_class, None)
+        for obj in objs:
+            if obj.id not in stored:
+                if s_class in SORTED_IDS:
+                    bisect.insort(SORTED_IDS[s_class], obj.id)
+                if s_class in CREATED_DATES:
+                    bisect.insort(CREATED_DATES[s_class], obj.created_at)
+            stored[obj.id] = obj
+            for index in indexes:
+                index.add(obj)
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Remove obj
+        """
+        self.remove_many(type(obj), [obj])
+
+    def remove_many(self, cls: type, objs: List[TypeVar('Base')]):
+        """ Remove objs, of class cls, with a single journal write
+        """
+        with self._file_lock(cls):
+            if SHARED:
+                self._catch_up(cls)
+            removed = self._delete(cls, [obj.id for obj in objs])
+            self.append_to_journal(cls, *({"op": "remove", "id": obj_id}
+                                          for obj_id in removed))
+
+    def _delete(self, cls: type, obj_ids: List[str]) -> List[str]:
+        """ Forget the objects of cls with these IDs, in memory and in
+        the indexes, and return the IDs that were stored
+        """
+        s_class = cls.__name__
+        stored = self.objects(cls)
+        indexes = self.indexes(cls).values()
+        SNAPSHOTS.pop(s_class, None)
+        removed = []
+        for obj_id in obj_ids:
+            previous = stored.get(obj_id)
+            if previous is None:
+                continue
+            del stored[obj_id]
+            ids = SORTED_IDS.get(s_class)
+            if ids is not None:
+                del ids[bisect.bisect_left(ids, obj_id)]
+            dates = CREATED_DATES.get(s_class)
+            if dates is not None:
+                del dates[bisect.bisect_left(dates, previous.created_at)]
+            for index in indexes:
+                index.discard(obj_id)
+            removed.append(obj_id)
+        return removed
+
+    def count(self, cls: type, created_after: datetime = None) -> int:
+        """ Count all objects of cls, or the ones created after
+        created_after, found by bisecting created_dates()
+        """
+        self.refresh(cls)
+        if created_after is None:
+            return len(self.objects(cls))
+        with self.lock(cls).reading():
+            dates = self.created_dates(cls)
+            return len(dates) - bisect.bisect_right(dates, created_after)
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object of cls by ID
+        """
+        self.refresh(cls)
+        with self.lock(cls).reading():
+            return self.objects(cls).get(id)
+
+    def page(self, cls: type, after: str = None,
+             limit: int = None) -> List[TypeVar('Base')]:
+        """ Return up to limit objects of cls, by ascending ID, whose
+        ID comes after after (from the first one when it is None)
+        """
+        self.refresh(cls)
+        with self.lock(cls).reading():
+            objs = self.objects(cls)
+            ids = self.sorted_ids(cls)
+            start = 0 if after is None else bisect.bisect_right(ids, after)
+            end = len(ids) if limit is None else start + limit
+            return [objs[obj_id] for obj_id in ids[start:end]]
+
+    def query(self, cls: type, attributes: dict = {}, ranges: dict = {},
+              after: str = None, limit: int = None,
+              fields: Tuple[str, ...] = None) -> List[dict]:
+        """ Return the JSON dictionaries of up to limit objects of cls
+        matching attributes and ranges, by ascending ID after after
+
+        An indexed attribute narrows the objects checked to the ones
+        saved with its value. Only the attributes in fields, when
+        given, are converted.
+        """
+        self.refresh(cls)
+        result = []
+        with self.lock(cls).reading():
+            objs = self.objects(cls)
+            indexes = self.indexes(cls)
+            ids = None
+            for k, v in attributes.items():
+                if k in indexes:
+                    try:
+                        ids = sorted(indexes[k].get(v))
+                    except TypeError:
+                        continue
+                    break
+            if ids is None:
+                ids = self.sorted_ids(cls)
+            start = 0 if after is None else bisect.bisect_right(ids, after)
+            if not attributes and not ranges and limit is not None:
+                ids = ids[start:start + limit]
+            else:
+                ids = ids[start:]
+            for obj_id in ids:
+                obj = objs.get(obj_id)
+                if obj is None or not _matches(obj, attributes, ranges):
+                    continue
+                result.append(obj.to_json(fields=fields))
+                if limit is not None and len(result) >= limit:
+                    break
+        return result
+
+    def search(self, cls: type,
+               attributes: dict = {}) -> List[TypeVar('Base')]:
+        """ Search all objects of cls with matching attributes
+
+        When an attribute is indexed, only the objects saved with its
+        value are checked instead of every object; otherwise the
+        objects of snapshot() are.
+        """
+        self.refresh(cls)
+
+        def _search(obj):
+            if len(attributes) == 0:
+                return True
+            for k, v in attributes.items():
+                if (getattr(obj, k) != v):
+                    return False
+            return True
+
+        candidates = None
+        with self.lock(cls).reading():
+            objs = self.objects(cls)
+            indexes = self.indexes(cls)
+            for k, v in attributes.items():
+                if k in indexes:
+                    try:
+                        ids = indexes[k].get(v)
+                    except TypeError:
+                        continue
+                    candidates = [objs[obj_id] for obj_id in ids]
+                    break
+        if candidates is None:
+            candidates = self.snapshot(cls)
+        return list(filter(_search, candidates))
+
+
+def _file_stat(file_path: str) -> Tuple[int, int, int]:
+    """ (inode, modification time, size) of a file, None if missing;
+    a snapshot replaced by another one has a different value
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _matches(obj: TypeVar('Base'), attributes: dict,
+             ranges: dict) -> bool:
+    """ Tell whether obj has the attributes and is within the ranges
+    """
+    for k, v in attributes.items():
+        if getattr(obj, k) != v:
+            return False
+    for k, (low, high) in ranges.items():
+        value = getattr(obj, k)
+        try:
+            if low is not None and not value > low:
+                return False
+            if high is not None and not value < high:
+                return False
+        except TypeError:
+            return False
+    return True
+
+
+_flusher = None
+
+
+def _run_flusher():
+    """ Flush queued changes periodically, or when asked to
+    """
+    while True:
+        FLUSH_NEEDED.wait(FLUSH_INTERVAL)
+        FLUSH_NEEDED.clear()
+        JSONStorage().flush()
+
+
+def _start_flusher():
+    """ Start the write-behind flusher thread once
+    """
+    global _flusher
+    if _flusher is not None:
+        return
+    with FILE_LOCK:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_run_flusher,
+                                        name="models-flusher", daemon=True)
+            _flusher.start()
+
+
+atexit.register(JSONStorage().flush)
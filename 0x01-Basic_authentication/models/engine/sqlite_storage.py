@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+""" SQLite storage: one table per model class, one column per attribute
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from typing import TypeVar, Iterator, List, Tuple
+import os
+import sqlite3
+import threading
+import weakref
+
+
+class _Lent():
+    """ Connection lent to a thread, by the process that opened it;
+    dropped with the thread-local data of the thread when it ends
+    """
+
+    __slots__ = ('pid', 'conn', '__weakref__')
+
+    def __init__(self, conn: sqlite3.Connection):
+        """ Initialize the loan of conn
+        """
+        self.pid = os.getpid()
+        self.conn = conn
+
+
+class SQLiteStorage():
+    """ Storage keeping objects in a SQLite database
+
+    The database runs in WAL mode so several processes can share it;
+    each thread has its own connection, given back to a pool when the
+    thread ends, for the next new thread. Statements are parameterized
+    and built once per class, so sqlite3 reuses the prepared
+    statements, and attributes listed in INDEXED_ATTRIBUTES get an
+    index. Objects are built from their row on every get/search.
+
+    The number of rows of each table is kept in the "_counts" table by
+    triggers, so counting does not scan the table.
+    """
+
+    def __init__(self, db_path: str):
+        """ Initialize the storage for the database at db_path
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._pool_lock = threading.Lock()
+        self._pool_pid = os.getpid()
+        self._idle = []
+        self._inherited = []
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Return the connection of the current thread
+
+        Connections outlive their threads, so a server starting a thread
+        per request does not reopen the database (and lose the prepared
+        statements) for each one. SQLite connections must not be used
+        across fork(): a forked process opens its own, and keeps the
+        ones it inherited, unused and never closed.
+        """
+        lent = getattr(self._local, 'lent', None)
+        if lent is not None and lent.pid == os.getpid():
+            return lent.conn
+        with self._pool_lock:
+            if self._pool_pid != os.getpid():
+                self._inherited.extend(self._idle)
+                self._idle = []
+                self._pool_pid = os.getpid()
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        lent = _Lent(conn)
+        weakref.finalize(lent, self._give_back, conn, lent.pid)
+        self._local.lent = lent
+        return conn
+
+    def _give_back(self, conn: sqlite3.Connection, pid: int):
+        """ Put the connection of a thread that ended in the pool, unless
+        it was opened before a fork
+        """
+        with self._pool_lock:
+            if pid == os.getpid() == self._pool_pid:
+                self._idle.append(conn)
+            else:
+                self._inherited.append(conn)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """ Run the block in a write transaction of the connection of
+        the current thread, rolled back if the block raises
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _sql(self, cls: type) -> dict:
+        """ Return the statements of cls, creating its table if needed
+        """
+        statements = self._statements.get(cls)
+        if statements is not None:
+            return statements
+        with self._lock:
+            if cls in self._statements:
+                return self._statements[cls]
+            table = '"{}"'.format(cls.__name__)
+            fields = cls.fields()
+            columns = ", ".join('"{}"'.format(f) for f in fields)
+            with self._transaction() as conn:
+                self._create_table(conn, cls)
+            statements = {
+                "fields": fields,
+                "select": 'SELECT {} FROM {}'.format(columns, table),
+                "save": 'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT("id") '
+                        'DO UPDATE SET {}'.format(
+                            table, columns, ", ".join("?" * len(fields)),
+                            ", ".join('"{0}" = excluded."{0}"'.format(f)
+                                      for f in fields)),
+                "remove": 'DELETE FROM {} WHERE "id" = ?'.format(table),
+                "count": 'SELECT "count" FROM "_counts" WHERE "class" = ?',
+                "count_created": 'SELECT COUNT(*) FROM {} '
+                                 'WHERE "created_at" > ?'.format(table),
+                "page": 'SELECT {} FROM {} WHERE "id" > ? ORDER BY "id" '
+                        'LIMIT ?'.format(columns, table),
+            }
+            self._statements[cls] = statements
+            return statements
+
+    def _create_table(self, conn: sqlite3.Connection, cls: type):
+        """ Create or complete the table of cls, its indexes (of
+        INDEXED_ATTRIBUTES and created_at) and its count triggers
+        """
+        name = cls.__name__
+        conn.execute('CREATE TABLE IF NOT EXISTS "{}" ("id" TEXT PRIMARY '
+                     'KEY)'.format(name))
+        existing = {row[1] for row in
+                    conn.execute('PRAGMA table_info("{}")'.format(name))}
+        for field in cls.fields():
+            if field not in existing:
+                conn.execute('ALTER TABLE "{}" ADD COLUMN "{}"'.format(
+                    name, field))
+        for attribute in cls.INDEXED_ATTRIBUTES + ('created_at',):
+            conn.execute('CREATE INDEX IF NOT EXISTS "{0}_{1}" '
+                         'ON "{0}" ("{1}")'.format(name, attribute))
+        conn.execute('CREATE TABLE IF NOT EXISTS "_counts" ("class" TEXT '
+                     'PRIMARY KEY, "count" INTEGER NOT NULL)')
+        for event, change in (("INSERT", "+"), ("DELETE", "-")):
+            conn.execute('CREATE TRIGGER IF NOT EXISTS "{0}_count_{1}" '
+                         'AFTER {1} ON "{0}" BEGIN UPDATE "_counts" SET '
+                         '"count" = "count" {2} 1 WHERE "class" = \'{0}\'; '
+                         'END'.format(name, event.lower(), change))
+        conn.execute('INSERT OR IGNORE INTO "_counts" VALUES (?, (SELECT '
+                     'COUNT(*) FROM "{}"))'.format(name), (name,))
+
+    def _build(self, cls: type, fields: tuple, row: tuple):
+        """ Build an object of cls from a table row
+        """
+        return cls(**dict(zip(fields, row)))
+
+    def load(self, cls: type):
+        """ Make sure the table of cls exists
+        """
+        self._sql(cls)
+
+    def save_all(self, cls: type):
+        """ Checkpoint the write-ahead log into the database file
+        """
+        self._sql(cls)
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def flush(self, cls: type = None):
+        """ Nothing to do: every write is committed when it is made
+        """
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or replace the row of obj
+        """
+        sql = self._sql(type(obj))
+        row = obj.to_json(True)
+        self._connection().execute(sql["save"],
+                                   [row.get(f) for f in sql["fields"]])
+
+    def save_many(self, cls: type, objs: List[TypeVar('Base')]):
+        """ Insert or replace the rows of objs, of class cls, in one
+        transaction
+        """
+        sql = self._sql(cls)
+        rows = ([row.get(f) for f in sql["fields"]]
+                for row in (obj.to_json(True) for obj in objs))
+        with self._transaction() as conn:
+            conn.executemany(sql["save"], rows)
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete the row of obj
+        """
+        sql = self._sql(type(obj))
+        self._connection().execute(sql["remove"], (obj.id,))
+
+    def remove_many(self, cls: type, objs: List[TypeVar('Base')]):
+        """ Delete the rows of objs, of class cls, in one transaction
+        """
+        sql = self._sql(cls)
+        with self._transaction() as conn:
+            conn.executemany(sql["remove"], ((obj.id,) for obj in objs))
+
+    def count(self, cls: type, created_after: datetime = None) -> int:
+        """ Count all objects of cls, or the ones created after
+        created_after, through the created_at index
+        """
+        from models.base import format_timestamp
+        sql = self._sql(cls)
+        if created_after is None:
+            return self._connection().execute(
+                sql["count"], (cls.__name__,)).fetchone()[0]
+        return self._connection().execute(
+            sql["count_created"],
+            (format_timestamp(created_after),)).fetchone()[0]
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object of cls by ID
+        """
+        objs = self.search(cls, {"id": id})
+        return objs[0] if objs else None
+
+    def page(self, cls: type, after: str = None,
+             limit: int = None) -> List[TypeVar('Base')]:
+        """ Return up to limit objects of cls, by ascending ID, whose
+        ID comes after after (from the first one when it is None)
+        """
+        sql = self._sql(cls)
+        rows = self._connection().execute(
+            sql["page"], ("" if after is None else after,
+                          -1 if limit is None else limit))
+        return [self._build(cls, sql["fields"], row) for row in rows]
+
+    def _where(self, cls: type, attributes: dict,
+               ranges: dict = {}) -> Tuple[List[str], list]:
+        """ Return the conditions and parameters selecting the objects
+        of cls with the attributes and within the (low, high) ranges,
+        or (None, None) when a value can not be stored, so nothing
+        matches
+
+        Raises AttributeError for an attribute the class does not have.
+        """
+        from models.base import format_timestamp
+        fields = self._sql(cls)["fields"]
+        conditions, params = [], []
+        bounds = [(k, "=", v) for k, v in attributes.items()]
+        for k, (low, high) in ranges.items():
+            bounds += [(k, op, v) for op, v in ((">", low), ("<", high))
+                       if v is not None]
+        for k, op, v in bounds:
+            if k not in fields:
+                raise AttributeError("'{}' object has no attribute '{}'"
+                                     .format(cls.__name__, k))
+            if v is None:
+                conditions.append('"{}" IS NULL'.format(k))
+                continue
+            if isinstance(v, datetime):
+                v = format_timestamp(v)
+            elif not isinstance(v, (str, int, float)):
+                return None, None
+            conditions.append('"{}" {} ?'.format(k, op))
+            params.append(v)
+        return conditions, params
+
+    def query(self, cls: type, attributes: dict = {}, ranges: dict = {},
+              after: str = None, limit: int = None,
+              fields: Tuple[str, ...] = None) -> List[dict]:
+        """ Return the JSON dictionaries of up to limit objects of cls
+        matching attributes and ranges, by ascending ID after after
+
+        Only the columns in fields, or the public ones, are selected,
+        and rows are turned into dictionaries without building objects.
+        """
+        conditions, params = self._where(cls, attributes, ranges)
+        if conditions is None:
+            return []
+        if fields is None:
+            fields = tuple(f for f in self._sql(cls)["fields"]
+                           if f[0] != '_')
+        conditions.append('"id" > ?')
+        params += ["" if after is None else after,
+                   -1 if limit is None else limit]
+        query = 'SELECT {} FROM "{}" WHERE {} ORDER BY "id" LIMIT ?'.format(
+            ", ".join('"{}"'.format(f) for f in fields), cls.__name__,
+            " AND ".join(conditions))
+        rows = self._connection().execute(query, params)
+        return [dict(zip(fields, row)) for row in rows]
+
+    def search(self, cls: type,
+               attributes: dict = {}) -> List[TypeVar('Base')]:
+        """ Search all objects of cls with matching attributes
+
+        Raises AttributeError for an attribute the class does not have.
+        """
+        sql = self._sql(cls)
+        conditions, params = self._where(cls, attributes)
+        if conditions is None:
+            return []
+        query = sql["select"]
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        rows = self._connection().execute(query, params)
+        return [self._build(cls, sql["fields"], row) for row in rows]
@@ -2,15 +2,23 @@
 """
 Defines Auth class for handling the API authentication
 """
+from contextlib import contextmanager
 from flask import request
-from typing import List, TypeVar
+from typing import Dict, Iterator, List, TypeVar
+import threading
+import time
 import os
 
 
 class Auth:
     """
     This class provides authentication functionality for the API.
+
+    Strategies implement current_user; the API calls resolve_user, which
+    runs it once per request and keeps the time spent in each phase of
+    the resolution (timed with timing) for request_timings.
     """
+    resolution = threading.local()
 
     def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
         """
@@ -59,6 +67,64 @@ class Auth:
         """
         return None
 
+    def resolve_user(self, request=None) -> TypeVar('User'):
+        """
+        Returns the current user of the request, resolving it with
+        current_user on the first call only.
+
+        Args:
+            request (Optional): The request object. Defaults to None.
+
+        Returns:
+            User: The current user object.
+        """
+        if request is None:
+            return self.current_user(request)
+        resolved = getattr(request, "auth_resolution", None)
+        if resolved is None:
+            self.resolution.timings = timings = {}
+            try:
+                user = self.current_user(request)
+            finally:
+                self.resolution.timings = None
+            resolved = (user, timings)
+            request.auth_resolution = resolved
+        return resolved[0]
+
+    def request_timings(self, request=None) -> Dict[str, float]:
+        """
+        Returns the time spent resolving the current user of the request.
+
+        Args:
+            request (Optional): The request object. Defaults to None.
+
+        Returns:
+            Dict[str, float]: Seconds spent per phase ("parse", "lookup",
+            "verify"), empty if the user was not resolved.
+        """
+        resolved = getattr(request, "auth_resolution", None)
+        return {} if resolved is None else resolved[1]
+
+    @contextmanager
+    def timing(self, phase: str) -> Iterator[None]:
+        """
+        Counts the time spent in the block in the given phase of the
+        resolution in progress, if any.
+
+        Args:
+            phase (str): The name of the phase.
+        """
+        timings = getattr(self.resolution, "timings", None)
+        if timings is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings[phase] = (timings.get(phase, 0.0) +
+                              time.perf_counter() - start)
+
     def session_cookie(self, request=None) -> str:
         """
         Retrieve the session cookie from the request.
@@ -1,15 +1,40 @@
 #!/usr/bin/env python3
-"""Basic auth module"""
+"""Basic auth module
+
+Credentials that were verified are cached, so that a client sending the
+same Authorization header again skips the user lookup and the password
+hashing: BASIC_AUTH_CACHE_SIZE headers at most (default 1024, 0 disables
+the cache), for BASIC_AUTH_CACHE_TTL seconds (default 300).
+"""
 from api.v1.auth.auth import Auth
+from collections import OrderedDict
+from os import getenv
 import base64
+import hashlib
+import hmac
+import secrets
+import threading
+import time
 from typing import Tuple, TypeVar
 from models.user import User
 
+CACHE_SIZE = int(getenv("BASIC_AUTH_CACHE_SIZE", "1024"))
+CACHE_TTL = float(getenv("BASIC_AUTH_CACHE_TTL", "300"))
+
 
 class BasicAuth(Auth):
     """
     BasicAuth class represents the basic authentication mechanism.
+
+    credential_cache maps a keyed hash of an Authorization header to
+    (expiry, user ID, email, keyed hash of the stored password) of the
+    user it proved to be, least recently used first. The hash key is
+    secret and drawn per process, so the cache holds no password, nor
+    anything to test guesses against.
     """
+    credential_cache = OrderedDict()
+    cache_lock = threading.Lock()
+    cache_key = secrets.token_bytes(32)
 
     def extract_base64_authorization_header(
             self, authorization_header: str) -> str:
@@ -92,16 +117,98 @@ class BasicAuth(Auth):
         if user_pwd is None or not isinstance(user_pwd, str):
             return None
         try:
-            users = User.search({"email": user_email})
+            with self.timing("lookup"):
+                users = User.search({"email": user_email})
             if not users or users == []:
                 return None
-            for u in users:
-                if u.is_valid_password(user_pwd):
-                    return u
+            with self.timing("verify"):
+                for u in users:
+                    if u.is_valid_password(user_pwd):
+                        return u
             return None
         except Exception:
             return None
 
+    def header_digest(self, authorization_header: str) -> bytes:
+        """
+        Computes the key of an Authorization header in the cache.
+
+        Args:
+            authorization_header (str): The authorization header string.
+
+        Returns:
+            bytes: The BLAKE2b of the header, keyed with the cache key.
+        """
+        return hashlib.blake2b(authorization_header.encode(),
+                               key=self.cache_key, digest_size=32).digest()
+
+    def password_digest(self, password: str) -> bytes:
+        """
+        Computes what the cache keeps of a stored password, to tell
+        whether it changed.
+
+        Args:
+            password (str): The stored (hashed) password of a user.
+
+        Returns:
+            bytes: The BLAKE2b of the stored password, keyed with the
+            cache key.
+        """
+        return hashlib.blake2b(password.encode(), key=self.cache_key,
+                               digest_size=32).digest()
+
+    def cached_user(self, digest: bytes) -> TypeVar('User'):
+        """
+        Retrieve the user a cached Authorization header proved to be.
+
+        The entry is dropped if it expired, or if the user was deleted
+        or changed email or password since.
+
+        Args:
+            digest (bytes): The key of the header in the cache.
+
+        Returns:
+            User: The user object, or None if the header is not cached.
+        """
+        with self.cache_lock:
+            entry = self.credential_cache.get(digest)
+        if entry is None:
+            return None
+        expiry, user_id, email, password_mac = entry
+        user = None
+        if expiry > time.monotonic():
+            user = User.get(user_id)
+            if (user is not None and
+                    (user.email != email or user.password is None or
+                     not hmac.compare_digest(
+                         self.password_digest(user.password),
+                         password_mac))):
+                user = None
+        with self.cache_lock:
+            if self.credential_cache.get(digest) is entry:
+                if user is None:
+                    del self.credential_cache[digest]
+                else:
+                    self.credential_cache.move_to_end(digest)
+        return user
+
+    def cache_user(self, digest: bytes, user: TypeVar('User')):
+        """
+        Cache the user an Authorization header proved to be, evicting
+        the least recently used headers beyond BASIC_AUTH_CACHE_SIZE.
+
+        Args:
+            digest (bytes): The key of the header in the cache.
+            user (User): The user whose credentials were verified.
+        """
+        entry = (time.monotonic() + CACHE_TTL, user.id, user.email,
+                 self.password_digest(user.password))
+        with self.cache_lock:
+            self.credential_cache[digest] = entry
+            self.credential_cache.move_to_end(digest)
+            while len(self.credential_cache) > CACHE_SIZE:
+                self.credential_cache.popitem(last=False)
+
     def current_user(self, request=None) -> TypeVar('User'):
         """
         Returns the current user based on the provided request.
@@ -114,11 +221,24 @@ class BasicAuth(Auth):
         """
         try:
             auth_header = self.authorization_header(request)
-            encoded_header = self.extract_base64_authorization_header(
-                auth_header)
-            decoded_header = self.decode_base64_authorization_header(
-                encoded_header)
-            user, pwd = self.extract_user_credentials(decoded_header)
-            return self.user_object_from_credentials(user, pwd)
+            if auth_header is None:
+                return None
+            digest = None
+            if CACHE_SIZE > 0:
+                with self.timing("lookup"):
+                    digest = self.header_digest(auth_header)
+                    user = self.cached_user(digest)
+                if user is not None:
+                    return user
+            with self.timing("parse"):
+                encoded_header = self.extract_base64_authorization_header(
+                    auth_header)
+                decoded_header = self.decode_base64_authorization_header(
+                    encoded_header)
+                user, pwd = self.extract_user_credentials(decoded_header)
+            user = self.user_object_from_credentials(user, pwd)
+            if user is not None and digest is not None:
+                self.cache_user(digest, user)
+            return user
         except Exception:
             return None
@@ -60,9 +60,11 @@ class SessionAuth(Auth):
             User: The current user object.
 
         """
-        session_id = self.session_cookie(request)
-        user_id = self.user_id_for_session_id(session_id)
-        return User.get(user_id)
+        with self.timing("parse"):
+            session_id = self.session_cookie(request)
+        with self.timing("lookup"):
+            user_id = self.user_id_for_session_id(session_id)
+            return User.get(user_id)
 
     def destroy_session(self, request=None):
         """
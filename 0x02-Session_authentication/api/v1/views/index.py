@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """ Module of Index views
 """
+from datetime import datetime, timedelta
 from flask import jsonify, abort
 from api.v1.views import app_views
 
@@ -18,11 +19,20 @@ def status() -> str:
 def stats() -> str:
     """ GET /api/v1/stats
     Return:
-      - the number of each objects
+      - the number of each objects, and of users created in the last
+        hour and day
+      - the number of sessions, with session authentication
     """
+    from api.v1.app import auth
     from models.user import User
+    now = datetime.utcnow()
     stats = {}
     stats['users'] = User.count()
+    stats['users_last_hour'] = User.count(now - timedelta(hours=1))
+    stats['users_last_day'] = User.count(now - timedelta(days=1))
+    sessions = getattr(auth, 'user_id_by_session_id', None)
+    if sessions is not None:
+        stats['sessions'] = len(sessions)
     return jsonify(stats)
 
 
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+""" Benchmark of BasicAuth.current_user for a client repeating its
+Authorization header, without and with the credential cache, among
+n_users users
+
+Usage: ./benchmark_basic_auth.py [n_checks] [n_users]   (default 20000 10000)
+"""
+import base64
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from api.v1.auth import basic_auth
+from api.v1.auth.basic_auth import BasicAuth
+from models import passwords
+from models.user import User
+
+
+def per_second(func, n_checks: int) -> float:
+    """ Number of func() calls per second
+    """
+    start = time.perf_counter()
+    for _ in range(n_checks):
+        func()
+    return n_checks / (time.perf_counter() - start)
+
+
+def main(n_checks: int, n_users: int):
+    """ Time n_checks authentications per hasher, without and with the
+    cache (fewer without it for the slow hashers)
+    """
+    os.chdir(tempfile.mkdtemp())
+    User.load_from_file()
+    users = [User(email="user-{}@hbtn.io".format(i)) for i in range(n_users)]
+    User.save_many(users)
+    bob = users[n_users // 2]
+    header = "Basic " + base64.b64encode(
+        "{}:H0lberton".format(bob.email).encode()).decode()
+    request = SimpleNamespace(headers={"Authorization": header})
+    auth = BasicAuth()
+    cache_size = basic_auth.CACHE_SIZE
+    for name in passwords.HASHERS:
+        passwords.set_default_hasher(name)
+        bob.password = "H0lberton"
+        bob.save()
+        for size in (0, cache_size):
+            basic_auth.CACHE_SIZE = size
+            auth.credential_cache.clear()
+            assert auth.current_user(request).id == bob.id
+            checks = n_checks if size or name == "sha256" \
+                else max(10, n_checks // 10000)
+            rate = per_second(lambda: auth.current_user(request), checks)
+            print("{:<15} {:<9} {:>12.0f} requests/s".format(
+                name, "cache" if size else "no cache", rate))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
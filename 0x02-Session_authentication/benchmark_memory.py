@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+""" Measure the memory held by each User in DATA
+
+Usage: ./benchmark_memory.py [n_users]   (default 100000)
+"""
+import sys
+import tracemalloc
+from models.engine.json_storage import DATA
+from models.user import User
+
+
+def main(n_users: int):
+    """ Build n_users users in DATA and report bytes per user
+    """
+    DATA["User"] = {}
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(n_users):
+        user = User(email="user{}@hbtn.io".format(i),
+                    _password="a5c904771b8617de27d3511d1f538094"
+                              "e26c120da663363b3f760f7b894f9d69",
+                    first_name="Bob", last_name="Dylan",
+                    created_at="2024-02-15T11:54:19",
+                    updated_at="2024-02-15T11:54:19")
+        DATA["User"][user.id] = user
+    used = tracemalloc.get_traced_memory()[0] - before
+    print("{} users: {:.0f} bytes per user".format(n_users, used / n_users))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
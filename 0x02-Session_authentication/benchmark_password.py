@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+""" Benchmark of User.is_valid_password: the former hex string check
+against the constant-time digest check, with each hasher
+
+Usage: ./benchmark_password.py [n_checks]   (default 100000)
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from models import passwords
+from models.user import User
+
+
+def per_second(func, n_checks: int) -> float:
+    """ Number of func() calls per second
+    """
+    start = time.perf_counter()
+    for _ in range(n_checks):
+        func()
+    return n_checks / (time.perf_counter() - start)
+
+
+def hex_check(user: User, pwd: str) -> bool:
+    """ The former User.is_valid_password: hex digests compared with ==
+    """
+    if pwd is None or type(pwd) is not str:
+        return False
+    if user.password is None:
+        return False
+    pwd_e = pwd.encode()
+    return hashlib.sha256(pwd_e).hexdigest().lower() == user.password
+
+
+def main(n_checks: int):
+    """ Time n_checks checks of a valid password per method (fewer
+    for the slow hashers)
+    """
+    os.chdir(tempfile.mkdtemp())
+    user = User(email="bob@hbtn.io")
+    user.password = "H0lberton"
+    results = [("sha256, hex ==",
+                per_second(lambda: hex_check(user, "H0lberton"), n_checks))]
+    for name, hasher in passwords.HASHERS.items():
+        passwords.set_default_hasher(name)
+        user.password = "H0lberton"
+        assert user.is_valid_password("H0lberton")
+        assert not user.is_valid_password("h0lberton")
+        checks = n_checks if name == "sha256" else max(10, n_checks // 10000)
+        results.append(("{}, compare_digest".format(name),
+                        per_second(lambda: user.is_valid_password(
+                            "H0lberton"), checks)))
+    for name, rate in results:
+        print("{:<30} {:>12.0f} checks/s".format(name, rate))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+""" Benchmark of User.search({"email": ...}) with the email index
+against a linear scan, for growing numbers of users
+
+Usage: ./benchmark_search.py [n_users ...]   (default 10000 100000 1000000)
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from models.engine.json_storage import DATA
+from models.user import User
+
+
+def write_store(n_users: int):
+    """ Write a .db_User.json holding n_users users
+    """
+    objs = {}
+    for i in range(n_users):
+        obj_id = "{:08d}".format(i)
+        objs[obj_id] = {"id": obj_id,
+                        "created_at": "2024-02-15T11:54:19",
+                        "updated_at": "2024-02-15T11:54:19",
+                        "email": "user{}@hbtn.io".format(i),
+                        "_password": None, "first_name": None,
+                        "last_name": None}
+    with open(".db_User.json", "w") as f:
+        json.dump(objs, f)
+
+
+def per_second(func, emails: list) -> float:
+    """ Number of func(email) calls per second
+    """
+    start = time.perf_counter()
+    for email in emails:
+        func(email)
+    return len(emails) / (time.perf_counter() - start)
+
+
+def linear(email: str) -> list:
+    """ The search without index: every user is checked
+    """
+    return [u for u in DATA["User"].values() if u.email == email]
+
+
+def main(sizes: list):
+    """ Run the benchmark for each size
+    """
+    os.chdir(tempfile.mkdtemp())
+    print("{:>9} {:>14} {:>14}".format("users", "scan search/s",
+                                       "index search/s"))
+    for n_users in sizes:
+        write_store(n_users)
+        User.load_from_file()
+        emails = ["user{}@hbtn.io".format(i * 7919 % n_users)
+                  for i in range(1000)]
+        assert User.search({"email": emails[0]}) == linear(emails[0])
+        scan = per_second(linear, emails[:max(10, 10000000 // n_users)])
+        indexed = per_second(lambda e: User.search({"email": e}), emails)
+        print("{:>9} {:>14.0f} {:>14.0f}".format(n_users, scan, indexed))
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [10000, 100000, 1000000])
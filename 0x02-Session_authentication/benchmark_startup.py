@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+""" Benchmark of User.load_from_file() cold start: a JSON snapshot
+parsed at once against the memory-mapped snapshot with offset index
+
+Usage: ./benchmark_startup.py [n_users]   (default 1000000)
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from models.engine.json_storage import write_snapshot
+
+CHILD = """
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+from models.user import User
+User.load_from_file()
+elapsed = time.perf_counter() - start
+user = User.search({{"email": "user42@hbtn.io"}})[0]
+rss = dict(line.split(":") for line in open("/proc/self/status")
+           if line.startswith("Rss"))
+print(elapsed, int(rss["RssAnon"].split()[0]) // 1024,
+      int(rss["RssFile"].split()[0]) // 1024)
+"""
+
+
+def user_json(i: int) -> dict:
+    """ JSON dictionary of the i-th user
+    """
+    return {"id": "{:08d}".format(i),
+            "created_at": "2024-02-15T11:54:19",
+            "updated_at": "2024-02-15T11:54:19",
+            "email": "user{}@hbtn.io".format(i),
+            "_password": "a5c904771b8617de27d3511d1f538094"
+                         "e26c120da663363b3f760f7b894f9d69",
+            "first_name": "Bob", "last_name": "Dylan"}
+
+
+def measure() -> tuple:
+    """ Cold-start seconds, then anonymous and file-backed RSS (MB),
+    of a fresh interpreter (Linux only: reads /proc/self/status)
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    out = subprocess.check_output([sys.executable, "-c",
+                                   CHILD.format(root=root)])
+    elapsed, anon, mapped = out.split()
+    return float(elapsed), int(anon), int(mapped)
+
+
+def main(n_users: int):
+    """ Write both snapshot formats and load each in a new process
+    """
+    os.chdir(tempfile.mkdtemp())
+    with open(".db_User.json", "w") as f:
+        json.dump({"{:08d}".format(i): user_json(i)
+                   for i in range(n_users)}, f)
+    eager = measure()
+    write_snapshot(".db_User.json",
+                   (("{:08d}".format(i), json.dumps(user_json(i)).encode())
+                    for i in range(n_users)),
+                   {"email": ["user{}@hbtn.io".format(i)
+                              for i in range(n_users)]})
+    lazy = measure()
+    print("{} users: load time, RSS heap, RSS mapped file".format(n_users))
+    print("JSON snapshot: {:>6.2f}s {:>6} MB {:>6} MB".format(*eager))
+    print("mmap + index:  {:>6.2f}s {:>6} MB {:>6} MB".format(*lazy))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
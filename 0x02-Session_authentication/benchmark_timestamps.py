@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+""" Benchmark of timestamp parsing and formatting in models.base:
+strptime/strftime against parse_timestamp/format_timestamp
+
+Usage: ./benchmark_timestamps.py [n_objects]   (default 1000000)
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+from models.base import TIMESTAMP_FORMAT, format_timestamp, parse_timestamp
+
+
+def seconds(func, values: list) -> float:
+    """ Time to call func on every value
+    """
+    start = time.perf_counter()
+    for value in values:
+        func(value)
+    return time.perf_counter() - start
+
+
+def main(n_objects: int):
+    """ Parse and format the two timestamps of n_objects objects
+    """
+    origin = datetime(2024, 2, 15, 11, 54, 19)
+    dates = [origin + timedelta(seconds=i) for i in range(2 * n_objects)]
+    strings = [d.strftime(TIMESTAMP_FORMAT) for d in dates]
+    assert [parse_timestamp(s) for s in strings[:1000]] == dates[:1000]
+    assert [format_timestamp(d) for d in dates[:1000]] == strings[:1000]
+
+    print("{} objects (2 timestamps each)".format(n_objects))
+    strptime = seconds(lambda s: datetime.strptime(s, TIMESTAMP_FORMAT),
+                       strings)
+    fast = seconds(parse_timestamp, strings)
+    print("parse:  strptime {:.2f}s, parse_timestamp {:.2f}s ({:.1f}x)"
+          .format(strptime, fast, strptime / fast))
+    strftime = seconds(lambda d: d.strftime(TIMESTAMP_FORMAT), dates)
+    fast = seconds(format_timestamp, dates)
+    print("format: strftime {:.2f}s, format_timestamp {:.2f}s ({:.1f}x)"
+          .format(strftime, fast, strftime / fast))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
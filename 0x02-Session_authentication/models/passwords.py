@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+""" Password hashing of the models
+
+A hasher turns a password into the string stored in User._password
+and checks passwords against it:
+  - "sha256": unsalted SHA-256 as 64 hex digits, the original format
+  - "pbkdf2_sha256": "pbkdf2_sha256$<iterations>$<salt>$<base64 hash>"
+
+MODELS_PASSWORD_HASHER selects the hasher of new passwords (default
+sha256) and MODELS_PBKDF2_ITERATIONS the cost of pbkdf2_sha256; stored
+passwords are checked with the hasher that made them.
+"""
+from functools import lru_cache
+from os import getenv
+from typing import Optional, Tuple
+import base64
+import hashlib
+import hmac
+import secrets
+
+
+class SHA256Hasher():
+    """ Unsalted SHA-256, stored as 64 hex digits
+    """
+
+    name = "sha256"
+
+    def encode(self, pwd: str) -> str:
+        """ Hash pwd into its stored form
+        """
+        return hashlib.sha256(pwd.encode()).hexdigest()
+
+    def decode(self, encoded: str) -> Optional[Tuple[tuple, bytes]]:
+        """ (parameters, raw digest) of a stored password, None if it is
+        not in this format
+        """
+        if len(encoded) != 64:
+            return None
+        try:
+            return (), bytes.fromhex(encoded)
+        except ValueError:
+            return None
+
+    def digest(self, pwd: str, parameters: tuple) -> bytes:
+        """ Raw digest of pwd with the parameters of a stored password
+        """
+        return hashlib.sha256(pwd.encode()).digest()
+
+    def is_current(self, parameters: tuple) -> bool:
+        """ Tell whether parameters are as strong as new hashes'
+        """
+        return True
+
+
+class PBKDF2Hasher():
+    """ Salted PBKDF2-HMAC-SHA256
+    """
+
+    name = "pbkdf2_sha256"
+
+    def __init__(self, iterations: int = 260000):
+        """ Initialize the hasher for new hashes of this cost
+        """
+        self.iterations = iterations
+
+    def encode(self, pwd: str) -> str:
+        """ Hash pwd into its stored form, with a new random salt
+        """
+        salt = secrets.token_hex(16)
+        digest = self.digest(pwd, (self.iterations, salt))
+        return "{}${}${}${}".format(self.name, self.iterations, salt,
+                                    base64.b64encode(digest).decode())
+
+    def decode(self, encoded: str) -> Optional[Tuple[tuple, bytes]]:
+        """ (parameters, raw digest) of a stored password, None if it is
+        not in this format
+        """
+        try:
+            name, iterations, salt, digest = encoded.split("$")
+            if name != self.name:
+                return None
+            return (int(iterations), salt), base64.b64decode(digest)
+        except ValueError:
+            return None
+
+    def digest(self, pwd: str, parameters: tuple) -> bytes:
+        """ Raw digest of pwd with the parameters of a stored password
+        """
+        iterations, salt = parameters
+        return hashlib.pbkdf2_hmac("sha256", pwd.encode(), salt.encode(),
+                                   iterations)
+
+    def is_current(self, parameters: tuple) -> bool:
+        """ Tell whether parameters are as strong as new hashes'
+        """
+        return parameters[0] >= self.iterations
+
+
+HASHERS = {}
+DEFAULT_HASHER = getenv("MODELS_PASSWORD_HASHER", "sha256")
+
+
+def register_hasher(hasher: object):
+    """ Make a hasher available, under its name
+    """
+    HASHERS[hasher.name] = hasher
+    _decode.cache_clear()
+
+
+def set_default_hasher(name: str):
+    """ Hash new passwords with the hasher registered under name
+    """
+    global DEFAULT_HASHER
+    if name not in HASHERS:
+        raise ValueError("unknown password hasher: {}".format(name))
+    DEFAULT_HASHER = name
+    _decode.cache_clear()
+
+
+@lru_cache(maxsize=65536)
+def _decode(encoded: str) -> Optional[Tuple[object, tuple, bytes, bool]]:
+    """ (hasher, parameters, raw digest, needs rehash) of a stored
+    password, None if no hasher knows its format
+
+    Cached, so the stored form of a password is parsed, and its hex or
+    base64 digest decoded, once rather than on every check.
+    """
+    for hasher in HASHERS.values():
+        decoded = hasher.decode(encoded)
+        if decoded is not None:
+            stale = hasher is not HASHERS.get(DEFAULT_HASHER) or \
+                not hasher.is_current(decoded[0])
+            return (hasher,) + decoded + (stale,)
+    return None
+
+
+def hash_password(pwd: str) -> str:
+    """ Hash pwd with the default hasher
+    """
+    return HASHERS[DEFAULT_HASHER].encode(pwd)
+
+
+def check_password(pwd: str, encoded: str) -> Tuple[bool, bool]:
+    """ Tell whether pwd matches a stored password, and whether the
+    stored password should be replaced by a hash of the default hasher
+
+    Raw digests are compared in constant time with hmac.compare_digest.
+    """
+    decoded = _decode(encoded)
+    if decoded is None:
+        return False, True
+    hasher, parameters, digest, stale = decoded
+    return hmac.compare_digest(hasher.digest(pwd, parameters),
+                               digest), stale
+
+
+def verify_password(pwd: str, encoded: str) -> bool:
+    """ Tell whether pwd matches a stored password
+    """
+    return check_password(pwd, encoded)[0]
+
+
+def needs_rehash(encoded: str) -> bool:
+    """ Tell whether a stored password was not made by the default
+    hasher, or with weaker parameters
+    """
+    decoded = _decode(encoded)
+    return decoded is None or decoded[3]
+
+
+register_hasher(SHA256Hasher())
+register_hasher(PBKDF2Hasher(int(getenv("MODELS_PBKDF2_ITERATIONS",
+                                        "260000"))))
+set_default_hasher(DEFAULT_HASHER)
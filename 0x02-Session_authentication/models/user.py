@@ -1,14 +1,23 @@
 #!/usr/bin/env python3
 """ User module
 """
-import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from models import passwords
 from models.base import Base
+from models.engine import storage
+import os
+
+_hash_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
 
 
 class User(Base):
     """ User class
     """
 
+    __slots__ = ('email', '_password', 'first_name', 'last_name')
+    INDEXED_ATTRIBUTES = ('email',)
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
@@ -26,22 +35,43 @@ class User(Base):
 
     @password.setter
     def password(self, pwd: str):
-        """ Setter of a new password: encrypt in SHA256
+        """ Setter of a new password: hash it with the default hasher
+        of models.passwords (SHA256 unless configured otherwise)
+        """
+        self._password = self.hash_password(pwd)
+
+    @staticmethod
+    def hash_password(pwd: str) -> Optional[str]:
+        """ Hash of pwd as stored in _password, None if not a string
         """
         if pwd is None or type(pwd) is not str:
-            self._password = None
-        else:
-            self._password = hashlib.sha256(pwd.encode()).hexdigest().lower()
+            return None
+        return passwords.hash_password(pwd)
+
+    @classmethod
+    def set_passwords(cls, users: List['User'], passwords: List[str]):
+        """ Set the password of each user, hashed on a pool of threads
+        """
+        hashes = _hash_executor.map(cls.hash_password, passwords)
+        for user, hashed in zip(users, hashes):
+            user._password = hashed
 
     def is_valid_password(self, pwd: str) -> bool:
         """ Validate a password
+
+        A valid password stored by another hasher than the default one,
+        or with weaker parameters, is hashed again and saved, leaving
+        updated_at as it was: the user did not change.
         """
         if pwd is None or type(pwd) is not str:
             return False
-        if self.password is None:
+        if self._password is None:
             return False
-        pwd_e = pwd.encode()
-        return hashlib.sha256(pwd_e).hexdigest().lower() == self.password
+        valid, stale = passwords.check_password(pwd, self._password)
+        if valid and stale:
+            self.password = pwd
+            storage.save(self)
+        return valid
 
     def display_name(self) -> str:
         """ Display User name based on email/first_name/last_name
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+""" Stress test of the model store: threads saving, removing, reading
+and searching users at the same time, then a consistency check, reads
+racing reloads of the store and the recovery from a journal line torn
+by a crash
+
+The threads start from users loaded from a snapshot, so with the json
+engine they also race to build the objects not read yet.
+
+Runs on the engine selected by MODELS_STORAGE, in a temporary directory.
+
+Usage: ./stress_store.py [n_threads] [n_operations]   (default 16 2000)
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from models.user import User
+
+
+def worker(n_operations: int, seed: int, mine: list, errors: list):
+    """ Run n_operations random operations on the store, on new users
+    and on the users whose IDs are in mine
+    """
+    rand = random.Random(seed)
+    for i in range(n_operations):
+        try:
+            action = rand.random()
+            if action < 0.35 or not mine:
+                user = User(email="{}-{}@hbtn.io".format(seed, i))
+                user.save()
+                mine.append(user.id)
+            elif action < 0.45:
+                user = User.get(rand.choice(mine))
+                user.first_name = str(i)
+                user.save()
+            elif action < 0.6:
+                User.get(mine.pop(rand.randrange(len(mine)))).remove()
+            elif action < 0.75:
+                email = User.get(rand.choice(mine)).email
+                assert len(User.search({"email": email})) == 1
+            elif action < 0.8:
+                User.all()
+            elif action < 0.9:
+                User.page(rand.choice(mine), 50)
+            elif action < 0.95:
+                User.query({"first_name": str(i - 1)}, fields=("email",))
+            else:
+                assert User.get(rand.choice(mine)) is not None
+        except Exception:
+            errors.append(traceback.format_exc())
+
+
+def check() -> list:
+    """ Return the inconsistencies between the ways to read the store
+    """
+    problems = []
+    users = User.all()
+    ids = [user.id for user in users]
+    if len(set(ids)) != len(ids):
+        problems.append("duplicate IDs in all()")
+    if User.count() != len(users):
+        problems.append("count() {} != {} users".format(User.count(),
+                                                        len(users)))
+    if sorted(ids) != [user.id for user in User.page()]:
+        problems.append("page() does not list all() by ID")
+    for user in users:
+        if User.search({"email": user.email}) != [user]:
+            problems.append("search by email misses {}".format(user.id))
+    User.save_to_file()
+    User.load_from_file()
+    if sorted(ids) != sorted(user.id for user in User.all()):
+        problems.append("reloaded users differ")
+    return problems
+
+
+def check_concurrent_reload(n_reloads: int = 20) -> list:
+    """ Return the errors of threads paging, searching and querying
+    users while the store is saved and reloaded n_reloads times
+    """
+    errors = []
+    done = threading.Event()
+
+    def reader():
+        """ Read the store until the reloads are done
+        """
+        while not done.is_set():
+            try:
+                User.page(None, 50)
+                User.search({"first_name": "0"})
+                User.query({"first_name": "0"}, fields=("email",))
+            except Exception:
+                errors.append(traceback.format_exc())
+                return
+
+    readers = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    for i in range(n_reloads):
+        User(email="reload-{}@hbtn.io".format(i)).save()
+        User.load_from_file()
+    done.set()
+    for thread in readers:
+        thread.join()
+    return ["read racing a reload: " + error for error in errors]
+
+
+def check_torn_journal() -> list:
+    """ Return the problems after restarting on a journal whose last
+    line was cut short by a crash, then saving a user (json engine)
+    """
+    journal_path = ".db_User.journal"
+    if not os.path.exists(journal_path):
+        return []
+    User.flush()
+    expected = User.count() + 1
+    with open(journal_path, 'a') as f:
+        f.write('{"op": "save", "obj": {"id": "torn')
+    User.load_from_file()
+    User(email="after-crash@hbtn.io").save()
+    User.flush()
+    User.load_from_file()
+    if User.count() != expected:
+        return ["{} users after a torn journal line, not {}".format(
+            User.count(), expected)]
+    return []
+
+
+def main(n_threads: int, n_operations: int):
+    """ Run the worker threads and check the store
+    """
+    os.chdir(tempfile.mkdtemp())
+    User.load_from_file()
+    first = [User(email="first-{}@hbtn.io".format(i))
+             for i in range(n_threads * n_operations // 4)]
+    User.save_many(first)
+    User.save_to_file()
+    User.load_from_file()
+    errors = []
+    threads = [threading.Thread(target=worker,
+                                args=(n_operations, seed,
+                                      [u.id for u in first[seed::n_threads]],
+                                      errors))
+               for seed in range(n_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    print("{} threads x {} operations: {:.0f} operations/s, {} users"
+          .format(n_threads, n_operations,
+                  n_threads * n_operations / elapsed, User.count()))
+    for error in errors[:5]:
+        print(error)
+    problems = check() + check_concurrent_reload() + check_torn_journal()
+    for problem in problems[:5]:
+        print(problem)
+    print("{} errors, {} inconsistencies".format(len(errors), len(problems)))
+    sys.exit(1 if errors or problems else 0)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 16,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
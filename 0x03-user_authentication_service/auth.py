@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 """The Auth module"""
+import os
 import uuid
 import bcrypt
+from concurrent.futures import ThreadPoolExecutor
 from db import DB
 from user import User
 from sqlalchemy.orm.exc import NoResultFound
 
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
 
 def _hash_password(password: str) -> bytes:
     """
@@ -18,10 +22,29 @@ def _hash_password(password: str) -> bytes:
         bytes: The hashed password.
     """
     password = password.encode()
-    hashed = bcrypt.hashpw(password, bcrypt.gensalt())
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt(BCRYPT_ROUNDS))
     return hashed
 
 
+def _needs_rehash(hashed_password: bytes) -> bool:
+    """
+    Tells whether a stored hash was made with an older bcrypt variant
+    or a lower cost than BCRYPT_ROUNDS.
+
+    Args:
+        hashed_password (bytes): The stored hash.
+
+    Returns:
+        bool: True if the hash should be replaced.
+    """
+    if hashed_password[:4] != b'$2b$' or hashed_password[6:7] != b'$':
+        return True
+    try:
+        return int(hashed_password[4:6]) < BCRYPT_ROUNDS
+    except ValueError:
+        return True
+
+
 def _generate_uuid() -> str:
     """returns a string repr of a new UUID"""
     return str(uuid.uuid4())
@@ -33,6 +56,7 @@ class Auth:
 
     def __init__(self):
         self._db = DB()
+        self._rehash_executor = ThreadPoolExecutor(max_workers=1)
 
     def register_user(self, email: str, password: str) -> User:
         """
@@ -66,13 +90,38 @@ class Auth:
         """
         try:
             user = self._db.find_user_by(email=email)
-            password = password.encode()
-            if bcrypt.checkpw(password, user.hashed_password):
+            if bcrypt.checkpw(password.encode(), user.hashed_password):
+                if _needs_rehash(user.hashed_password):
+                    self._rehash_executor.submit(
+                        self._upgrade_password, user.id,
+                        user.hashed_password, password)
                 return True
             return False
         except NoResultFound:
             return False
 
+    def _upgrade_password(self, user_id: int, hashed_password: bytes,
+                          password: str) -> bool:
+        """
+        Rehashes a password whose stored hash is outdated, after a
+        successful login, so raising BCRYPT_ROUNDS needs no reset.
+
+        The new hash is only stored if the stored one is still the hash
+        the password was checked against: a password changed since the
+        login is not overwritten with the old one.
+
+        Args:
+            user_id (int): The ID of the user.
+            hashed_password (bytes): The hash the password was checked
+            against.
+            password (str): The password the user just logged in with.
+
+        Returns:
+            bool: True if the stored hash was replaced.
+        """
+        return self._db.replace_password(user_id, hashed_password,
+                                         _hash_password(password))
+
     def create_session(self, email: str) -> str:
         """
         Creates a session for the user with the given email.
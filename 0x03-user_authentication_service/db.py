@@ -125,3 +125,29 @@ class DB:
             self._session.commit()
         except NoResultFound:
             raise ValueError
+
+    def replace_password(self, user_id: int, old_hash: bytes,
+                         new_hash: bytes) -> bool:
+        """
+        Replace the hashed password of a user, only if it still is the
+        given one, in a session of its own so any thread may call it.
+
+        Args:
+            user_id (int): The id of the user to update.
+            old_hash (bytes): The hashed password expected in the database.
+            new_hash (bytes): The hashed password to store.
+
+        Returns:
+            bool: True if the password was replaced, False if the user
+            is gone or its hashed password changed in the meantime.
+        """
+        session = sessionmaker(bind=self._engine)()
+        try:
+            updated = session.query(User).filter_by(
+                id=user_id, hashed_password=old_hash).update(
+                    {"hashed_password": new_hash},
+                    synchronize_session=False)
+            session.commit()
+            return updated == 1
+        finally:
+            session.close()